@@ -1,15 +1,27 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field, conlist, constr
 from django.core.cache import cache
+import copy
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 WHY_MAX = 50
 CITY_DNA_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 días
 
+# Per-process copy in front of the Django cache (skips the Redis round-trip for
+# repeat cities in the same worker). Short TTL so entries refreshed in Redis
+# are picked up; least recently used entries are evicted past the max size.
+# Entries are private copies and callers get their own copy, so mutating a
+# returned City DNA can't leak into later plans.
+CITY_DNA_LOCAL_TTL_SECONDS = 60 * 60
+CITY_DNA_LOCAL_MAX = 512
+_city_dna_local: "OrderedDict[str, tuple]" = OrderedDict()
+
 
 class CityDNA(BaseModel):
     city: str
@@ -37,6 +49,21 @@ def _cache_key_city_dna(city: str, language: str) -> str:
     return f"city_dna:v1:{safe_city}:{safe_lang}"
 
 
+def _remember_city_dna(key: str, dna: Dict[str, Any]) -> None:
+    _city_dna_local[key] = (time.monotonic() + CITY_DNA_LOCAL_TTL_SECONDS, copy.deepcopy(dna))
+    _city_dna_local.move_to_end(key)
+    if len(_city_dna_local) > CITY_DNA_LOCAL_MAX:
+        _city_dna_local.popitem(last=False)
+
+
+def _recall_city_dna(key: str) -> Optional[Dict[str, Any]]:
+    entry = _city_dna_local.get(key)
+    if entry is None or entry[0] <= time.monotonic():
+        return None
+    _city_dna_local.move_to_end(key)
+    return copy.deepcopy(entry[1])
+
+
 class SlotPick(BaseModel):
     slot_id: str
     selected_place_id: str
@@ -268,14 +295,19 @@ class SlotLLM:
     def get_city_dna(self, *, city: str, language: str = "es") -> Dict[str, Any]:
         """
         Get City DNA with robust fallback strategy:
-        1. Check cache
+        1. Check cache (process-local, then Django cache)
         2. Try LLM
         3. Fall back to static data from city_fallbacks.py
         """
         key = _cache_key_city_dna(city, language)
+        local = _recall_city_dna(key)
+        if local is not None:
+            return local
+
         cached = cache.get(key)
         if cached:
             logger.info(f"   City DNA cache HIT: {city}")
+            _remember_city_dna(key, cached)
             return cached
 
         # Try LLM
@@ -285,6 +317,7 @@ class SlotLLM:
                 dna = self._llm_build_city_dna(city=city, language=language)
                 parsed = CityDNA(**dna).model_dump()
                 cache.set(key, parsed, CITY_DNA_TTL_SECONDS)
+                _remember_city_dna(key, parsed)
                 logger.info(f"   City DNA generated: {len(parsed['food_typicals'])} foods")
                 return parsed
             except Exception as e:
@@ -297,6 +330,7 @@ class SlotLLM:
         
         # Cache fallback with shorter TTL
         cache.set(key, fallback, 7*24*60*60)  # 7 days
+        _remember_city_dna(key, fallback)
         return fallback
 
     def _llm_build_city_dna(self, *, city: str, language: str) -> Dict[str, Any]:
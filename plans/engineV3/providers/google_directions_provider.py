@@ -14,10 +14,30 @@ MODE_MAP = {
     "drive": "driving",
 }
 
+# Routes barely change, so keep them across regenerations; empty results
+# (often transient) expire quickly.
+DIRECTIONS_CACHE_TTL = 60 * 60 * 24 * 7
+EMPTY_DIRECTIONS_CACHE_TTL = 60 * 10
+
 @dataclass
 class GoogleDirectionsProvider:
     api_key: str
 
+    def cache_key(
+        self,
+        *,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        mode: str,
+        language: str = "en",
+        region: Optional[str] = None,
+    ) -> str:
+        """Cache key used by get_directions (lets callers batch lookups with get_many)"""
+        gmode = MODE_MAP.get(mode, mode)
+        (olat, olng) = origin
+        (dlat, dlng) = destination
+        return f"gdir:{olat:.5f},{olng:.5f}:{dlat:.5f},{dlng:.5f}:{gmode}:{language}:{region}"
+
     def get_directions(
         self,
         *,
@@ -32,7 +52,9 @@ class GoogleDirectionsProvider:
         (olat, olng) = origin
         (dlat, dlng) = destination
 
-        cache_key = f"gdir:{olat:.5f},{olng:.5f}:{dlat:.5f},{dlng:.5f}:{gmode}:{language}:{region}"
+        cache_key = self.cache_key(
+            origin=origin, destination=destination, mode=mode, language=language, region=region
+        )
         cached = cache.get(cache_key)
         if cached is not None:
             return cached
@@ -54,7 +76,7 @@ class GoogleDirectionsProvider:
         routes = j.get("routes") or []
         if not routes:
             out = {"distance_m": 0, "duration_sec": 0, "polyline": None, "raw": j}
-            cache.set(cache_key, out, 60 * 10)
+            cache.set(cache_key, out, EMPTY_DIRECTIONS_CACHE_TTL)
             return out
 
         route0 = routes[0]
@@ -69,7 +91,7 @@ class GoogleDirectionsProvider:
             "duration_sec": duration_sec,
             "polyline": polyline,
         }
-        cache.set(cache_key, out, 60 * 10)
+        cache.set(cache_key, out, DIRECTIONS_CACHE_TTL)
         return out
 
 
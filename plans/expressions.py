@@ -0,0 +1,42 @@
+"""
+Database expressions used by the API views
+"""
+import json
+
+from django.db import NotSupportedError
+from django.db.models import F, Func, JSONField
+
+
+class JSONMerge(Func):
+    """
+    Shallow-merge a dict into a JSON column inside the UPDATE itself:
+    column = COALESCE(column, '{}') || patch
+
+    Lets callers patch a few keys without reading the blob back into Python,
+    and concurrent patches of different keys don't overwrite each other.
+    A None value is stored as JSON null on every backend (it does not
+    delete the key).
+    """
+    output_field = JSONField()
+
+    def __init__(self, field_name, patch):
+        super().__init__(F(field_name))
+        self.items = [(key, json.dumps(value)) for key, value in patch.items()]
+        self.patch = json.dumps(patch)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f"(COALESCE({sql}, '{{}}'::jsonb) || %s::jsonb)", (*params, self.patch)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # json_set per key rather than json_patch: RFC 7396 patching would
+        # delete keys whose value is null, unlike Postgres' ||
+        sql, params = compiler.compile(self.source_expressions[0])
+        args = []
+        for key, value in self.items:
+            args.append(", %s, json(%s)")
+            params = (*params, f'$.{json.dumps(key)}', value)
+        return f"json_set(COALESCE({sql}, '{{}}'){''.join(args)})", params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"JSONMerge is not implemented for {connection.vendor}")
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-15 22:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0012_plan_plan_timezone_plan_timing_intent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['user', '-created_at'], name='plans_plan_user_id_62bfa5_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-15 22:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0013_plan_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='savedplace',
+            name='plans_saved_user_id_82f3d2_idx',
+        ),
+    ]
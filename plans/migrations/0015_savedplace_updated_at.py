@@ -0,0 +1,20 @@
+# Generated by Django 4.2.10 on 2026-10-15 23:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0014_savedplace_drop_redundant_user_place_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedplace',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Last change to this row (drives the for_map ETag)'),
+            preserve_default=False,
+        ),
+    ]
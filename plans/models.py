@@ -117,6 +117,9 @@ class Plan(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
 
     def __str__(self):
         return f"Plan {self.id} - {self.status}"
@@ -488,12 +491,17 @@ class SavedPlace(models.Model):
         help_text="When user visited"
     )
     
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text="Last change to this row (drives the for_map ETag)"
+    )
+    
     class Meta:
         ordering = ['-saved_at']
+        # The unique index also serves the (user, place_id) lookups
         unique_together = ['user', 'place_id']
         indexes = [
             models.Index(fields=['user', '-saved_at']),
-            models.Index(fields=['user', 'place_id']),
         ]
     
     def __str__(self):
@@ -0,0 +1,61 @@
+"""
+orjson-backed JSON renderer for API responses
+"""
+import orjson
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+_DRF_ENCODER = encoders.JSONEncoder()
+
+# Datetimes go through DRF's encoder so the wire format stays identical
+# (millisecond precision, 'Z' suffix for UTC).
+_ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_SERIALIZE_NUMPY
+    | orjson.OPT_PASSTHROUGH_DATETIME
+)
+
+
+def _default(obj):
+    """Fallback for types orjson can't encode (Decimal, UUID, lazy strings...)"""
+    return _DRF_ENCODER.default(obj)
+
+
+class OrjsonRenderer(renderers.JSONRenderer):
+    """Drop-in replacement for DRF's JSONRenderer using orjson"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        option = _ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context):
+            option |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=_default, option=option)
+
+        # Keep the output a strict javascript subset, same as DRF
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def stream_json_array(queryset, serializer, chunk_size=500):
+    """
+    Yield a JSON array of serializer.to_representation(row) for each row.
+
+    Rows come off a server-side cursor and are encoded one chunk at a time,
+    so the full list never sits in memory as objects or as one big buffer.
+    """
+    yield b'['
+    sep = b''
+    batch = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        item = serializer.to_representation(obj)
+        batch.append(orjson.dumps(item, default=_default, option=_ORJSON_OPTIONS))
+        if len(batch) >= chunk_size:
+            yield sep + b','.join(batch)
+            sep = b','
+            batch = []
+    if batch:
+        yield sep + b','.join(batch)
+    yield b']'
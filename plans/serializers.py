@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from .models import Plan, Stop, Leg, StopFeedback, Profile, SavedPlace
 from datetime import datetime, timedelta
-import pytz
+from .timezones import UNKNOWN_TIMEZONE_ERRORS, get_timezone
 
 
 class ProfileSerializer(serializers.ModelSerializer):
@@ -12,6 +12,14 @@ class ProfileSerializer(serializers.ModelSerializer):
 
 
 class StopSerializer(serializers.ModelSerializer):
+    # JSON columns declared explicitly so DRF skips the model field mapping
+    tags = serializers.JSONField(required=False)
+    peak_hours = serializers.JSONField(required=False)
+    open_status_json = serializers.JSONField(required=False)
+    opening_hours_json = serializers.JSONField(required=False, allow_null=True)
+    place_types = serializers.JSONField(required=False, allow_null=True)
+    open_label = serializers.SerializerMethodField()
+
     class Meta:
         model = Stop
         fields = [
@@ -35,21 +43,21 @@ class StopSerializer(serializers.ModelSerializer):
             'place_types',
             'popularity',
             'why_now',
+            'open_label',
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'open_label']
 
     def get_open_label(self, obj):
+        # Annotated by PlanViewSet._detail_qs; computed for any other stop
+        label = getattr(obj, 'open_label', None)
+        if label is not None:
+            return label
         if obj.open_status_at_planned_time is True:
             return "Open"
         elif obj.open_status_at_planned_time is False:
             return "Closed"
         return "Hours unknown"
 
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        data['open_label'] = self.get_open_label(instance)
-        return data
-
 
 class LegSerializer(serializers.ModelSerializer):
     class Meta:
@@ -66,6 +74,9 @@ class LegSerializer(serializers.ModelSerializer):
 
 class PlanListSerializer(serializers.ModelSerializer):
     stop_count = serializers.SerializerMethodField()
+    city_name = serializers.SerializerMethodField()
+    country = serializers.SerializerMethodField()
+    country_code = serializers.SerializerMethodField()
 
     class Meta:
         model = Plan
@@ -83,7 +94,10 @@ class PlanListSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
 
     def get_stop_count(self, obj):
-        return obj.stops.count()
+        # The list queryset annotates the count; fall back for other callers
+        count = getattr(obj, 'stop_count', None)
+        return obj.stops.count() if count is None else count
+
     def get_city_name(self, obj):
         """Extract city name from inputs"""
         inputs = obj.inputs_json or {}
@@ -127,6 +141,15 @@ class PlanDetailSerializer(serializers.ModelSerializer):
         ]
 
 
+class PlanStateSerializer(serializers.ModelSerializer):
+    """Slim plan body returned by status transitions"""
+
+    class Meta:
+        model = Plan
+        fields = ['id', 'status', 'confidence_locked', 'updated_at']
+        read_only_fields = fields
+
+
 class PlanInputSerializer(serializers.Serializer):
     """
     Input serializer for plan generation (LEGACY NAME)
@@ -139,8 +162,9 @@ class PlanInputSerializer(serializers.Serializer):
     city_name = serializers.CharField(max_length=200)
 
 
-    lat = serializers.FloatField(required=False, allow_null=True)
-    lng = serializers.FloatField(required=False, allow_null=True)
+    # V3 requires coordinates to query Google Places
+    lat = serializers.FloatField()
+    lng = serializers.FloatField()
 
     # IMPORTANT: validate() uses timezone; it previously didn't exist.
     timezone = serializers.CharField(required=False, default='Europe/Berlin')
@@ -186,7 +210,10 @@ class PlanInputSerializer(serializers.Serializer):
         Derive start_time and end_time from timing_intent
         ALWAYS relative to plan timezone
         """
-        plan_tz = pytz.timezone(attrs.get('timezone', 'Europe/Berlin'))
+        try:
+            plan_tz = get_timezone(attrs.get('timezone', 'Europe/Berlin'))
+        except UNKNOWN_TIMEZONE_ERRORS:
+            raise serializers.ValidationError({'timezone': 'Unknown timezone'})
         
         # ✅ THE KEY: now_local is PLAN timezone, not device
         now_local = datetime.now(plan_tz)
@@ -279,6 +306,22 @@ class SwapStopInputSerializer(serializers.Serializer):
 SwapStopSerializer = SwapStopInputSerializer
 
 
+class BatchSwapItemSerializer(SwapStopInputSerializer):
+    plan_id = serializers.UUIDField()
+
+
+class BatchSwapInputSerializer(serializers.Serializer):
+    swaps = BatchSwapItemSerializer(many=True, allow_empty=False, max_length=50)
+
+
+class StopRefSerializer(serializers.Serializer):
+    stop_id = serializers.UUIDField()
+
+
+class AdjustDurationInputSerializer(StopRefSerializer):
+    duration_min = serializers.IntegerField(min_value=1, max_value=1440)
+
+
 class DelayInputSerializer(serializers.Serializer):
     stop_id = serializers.UUIDField()
     delta_min = serializers.IntegerField(min_value=1)
@@ -318,6 +361,10 @@ class SavedPlaceSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'saved_at']
 
     def validate(self, data):
+        """
+        Reject duplicates before hitting the unique constraint.
+        The exists() probe is served by the (user, place_id) unique index on SavedPlace.
+        """
         user = self.context['request'].user
         place_id = data.get('place_id')
 
@@ -331,8 +378,8 @@ class SavedPlaceSerializer(serializers.ModelSerializer):
 class SavedPlaceCreateSerializer(serializers.Serializer):
     place_id = serializers.CharField(required=True)
     name = serializers.CharField(required=True)
-    lat = serializers.DecimalField(max_digits=10, decimal_places=7, required=True)
-    lng = serializers.DecimalField(max_digits=10, decimal_places=7, required=True)
+    lat = serializers.FloatField(required=True, min_value=-90, max_value=90)
+    lng = serializers.FloatField(required=True, min_value=-180, max_value=180)
     category = serializers.CharField(required=False, allow_blank=True)
     photo_reference = serializers.CharField(required=False, allow_blank=True)
     rating = serializers.FloatField(required=False, allow_null=True)
@@ -342,16 +389,21 @@ class SavedPlaceCreateSerializer(serializers.Serializer):
     notes = serializers.CharField(required=False, allow_blank=True)
 
     def create(self, validated_data):
-        user = self.context['request'].user
+        request = self.context['request']
+        user = request.user
         plan_id = validated_data.pop('plan_id', None)
 
-        from .models import Plan
         plan = None
         if plan_id:
-            try:
-                plan = Plan.objects.get(id=plan_id, user=user)
-            except Plan.DoesNotExist:
-                plan = None
+            # Memoize per request: bulk saves under the same plan hit the DB once
+            plan_cache = getattr(request, '_plan_cache', None)
+            if plan_cache is None:
+                plan_cache = request._plan_cache = {}
+            if plan_id in plan_cache:
+                plan = plan_cache[plan_id]
+            else:
+                plan = Plan.objects.filter(id=plan_id, user=user).only('id').first()
+                plan_cache[plan_id] = plan
 
         saved_place = SavedPlace.objects.create(
             user=user,
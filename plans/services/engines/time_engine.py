@@ -2,12 +2,58 @@
 Time-aware logic: opening hours, daypart modifiers
 """
 from datetime import datetime, time, timedelta
+from functools import lru_cache
 from plans.constants.dayparts import get_daypart
 from plans.constants.categories import get_category_metadata
 import logging
+from plans.timezones import UNKNOWN_TIMEZONE_ERRORS, get_timezone
 
 logger = logging.getLogger(__name__)
 
+# Category metadata is static; memoize it since daypart_category_modifier runs
+# once per candidate/slot. The returned dicts are shared: treat as read-only.
+# (get_daypart takes a datetime, so it gains nothing from caching.)
+get_category_metadata = lru_cache(maxsize=256)(get_category_metadata)
+
+# Base score modifiers keyed by (daypart, category)
+_DAYPART_MODIFIERS = {
+    ('morning', 'cafe'): 1.5,
+    ('morning', 'bakery'): 1.3,
+    ('morning', 'park'): 1.2,
+    ('morning', 'fitness'): 1.0,
+    ('morning', 'bar'): -2.5,
+    ('morning', 'nightclub'): -3.0,
+    ('morning', 'nightlife'): -2.0,
+
+    ('midday', 'restaurant'): 1.2,
+    ('midday', 'casual_dining'): 1.3,
+    ('midday', 'cafe'): 1.0,
+    ('midday', 'museum'): 1.1,
+    ('midday', 'shopping'): 1.0,
+    ('midday', 'bar'): -1.5,
+    ('midday', 'nightclub'): -3.0,
+
+    ('afternoon', 'cafe'): 1.2,
+    ('afternoon', 'park'): 1.1,
+    ('afternoon', 'gallery'): 1.0,
+    ('afternoon', 'shopping'): 1.0,
+    ('afternoon', 'nightclub'): -2.5,
+
+    ('evening', 'restaurant'): 1.5,
+    ('evening', 'bar'): 1.2,
+    ('evening', 'viewpoint'): 1.1,
+    ('evening', 'performance'): 1.3,
+    ('evening', 'nightclub'): -0.5,  # Still early for clubs
+
+    ('late', 'bar'): 1.0,
+    ('late', 'nightclub'): 0.5,
+    ('late', 'nightlife'): 1.0,
+    ('late', 'restaurant'): -1.0,
+    ('late', 'cafe'): -2.0,
+    ('late', 'museum'): -3.0,
+    ('late', 'park'): -2.0,
+}
+
 
 def is_open_at(candidate, dt_local, duration_min):
     """
@@ -58,6 +104,16 @@ def is_open_at(candidate, dt_local, duration_min):
     return (None, 'low', 'incomplete_hours_data')
 
 
+_MINUTES_PER_DAY = 24 * 60
+_MINUTES_PER_WEEK = 7 * _MINUTES_PER_DAY
+
+
+def _week_minute(day, hhmm):
+    """Minutes since Sunday 00:00 for a Google day (0=Sunday) and HHMM int"""
+    hours, minutes = divmod(hhmm, 100)
+    return day * _MINUTES_PER_DAY + hours * 60 + minutes
+
+
 def _check_periods(periods, dt_local, duration_min):
     """
     Check opening hours using Google Places periods format
@@ -70,73 +126,60 @@ def _check_periods(periods, dt_local, duration_min):
         },
         ...
     ]
+
+    Each period is treated as a window on a 7-day circle starting at its
+    open time, so overnight hours and Saturday->Sunday wraps need no
+    special cases: one modulo gives the minutes elapsed since it opened.
     """
     try:
         # Get day of week (0=Sunday in Google Places)
         weekday = (dt_local.weekday() + 1) % 7  # Convert Python's Monday=0 to Google's Sunday=0
-        
-        # Time as HHMM integer
-        current_time = dt_local.hour * 100 + dt_local.minute
-        end_time_dt = dt_local + timedelta(minutes=duration_min)
-        end_time = end_time_dt.hour * 100 + end_time_dt.minute
-        
-        # Check if end time crosses midnight
-        crosses_midnight = end_time_dt.day != dt_local.day
-        
+
+        # Minutes since local midnight / since Sunday 00:00
+        day_minute = dt_local.hour * 60 + dt_local.minute
+        now = weekday * _MINUTES_PER_DAY + day_minute
+
         for period in periods:
-            open_day = period.get('open', {}).get('day')
-            open_time = period.get('open', {}).get('time', '0000')
-            close_info = period.get('close', {})
-            
-            # Convert times to int
+            open_info = period.get('open', {})
+            open_day = open_info.get('day')
+            if not isinstance(open_day, int):
+                continue
             try:
-                open_time_int = int(open_time)
+                opens_at = _week_minute(open_day, int(open_info.get('time', '0000')))
             except (ValueError, TypeError):
                 continue
-            
+
+            close_info = period.get('close', {})
+
             # Handle 24/7 (no close time)
             if not close_info:
                 if open_day == weekday:
                     return (True, 'high', 'open_24_7')
                 continue
-            
+
             close_day = close_info.get('day')
-            close_time = close_info.get('time', '2359')
-            
+            if not isinstance(close_day, int):
+                continue
             try:
-                close_time_int = int(close_time)
+                closes_at = _week_minute(close_day, int(close_info.get('time', '2359')))
             except (ValueError, TypeError):
                 continue
-            
-            # Check if this period applies to our day
-            if open_day == weekday:
-                # Handle overnight hours (e.g., open 18:00, close 02:00 next day)
-                if close_day != open_day:
-                    # Overnight period
-                    if current_time >= open_time_int:
-                        # We're in the opening part (before midnight)
-                        if crosses_midnight:
-                            # Visit crosses midnight, check if end time is before close
-                            next_day = (weekday + 1) % 7
-                            if close_day == next_day and end_time <= close_time_int:
-                                return (True, 'high', 'periods_check_overnight')
-                            return (False, 'high', 'closes_during_visit')
-                        return (True, 'high', 'periods_check')
-                else:
-                    # Same-day period
-                    if open_time_int <= current_time < close_time_int:
-                        # Check if visit ends before closing
-                        if end_time <= close_time_int or end_time < current_time:  # Handle midnight wrap
-                            return (True, 'high', 'periods_check')
-                        return (False, 'high', 'closes_during_visit')
-            
-            # Check if we're in the closing part of overnight hours from previous day
-            if close_day == weekday and open_day != weekday:
-                if current_time < close_time_int:
-                    if end_time <= close_time_int:
-                        return (True, 'high', 'periods_check_overnight_continuation')
-                    return (False, 'high', 'closes_during_visit')
-        
+
+            # Closing "before" opening means the period wraps past Saturday night
+            span = (closes_at - opens_at) % _MINUTES_PER_WEEK
+            elapsed = (now - opens_at) % _MINUTES_PER_WEEK
+            if elapsed >= span:
+                continue
+            if elapsed + duration_min > span:
+                return (False, 'high', 'closes_during_visit')
+            if elapsed > day_minute:
+                # Opened on an earlier day (closing part of overnight hours)
+                return (True, 'high', 'periods_check_overnight_continuation')
+            if day_minute + duration_min >= _MINUTES_PER_DAY:
+                # Visit runs past midnight inside an overnight period
+                return (True, 'high', 'periods_check_overnight')
+            return (True, 'high', 'periods_check')
+
         # No matching period found
         return (False, 'high', 'closed_at_time')
         
@@ -145,6 +188,20 @@ def _check_periods(periods, dt_local, duration_min):
         return (None, 'low', f'period_parsing_error:{str(e)[:50]}')
 
 
+_WEEKDAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+@lru_cache(maxsize=1024)
+def _parse_weekday_text_index(weekday_text):
+    """Map day name -> first weekday_text line starting with it"""
+    index = {}
+    for line in weekday_text:
+        for day_name in _WEEKDAY_NAMES:
+            if day_name not in index and line.startswith(day_name):
+                index[day_name] = line
+    return index
+
+
 def _check_weekday_text(weekday_text, dt_local, duration_min):
     """
     Fallback: parse weekday_text if periods not available
@@ -160,25 +217,22 @@ def _check_weekday_text(weekday_text, dt_local, duration_min):
     """
     try:
         # Map Python weekday to Google's format
-        weekday_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        day_name = weekday_names[dt_local.weekday()]
+        day_name = _WEEKDAY_NAMES[dt_local.weekday()]
         
         # Find matching day in weekday_text
-        matching_line = None
-        for line in weekday_text:
-            if line.startswith(day_name):
-                matching_line = line
-                break
+        matching_line = _parse_weekday_text_index(tuple(weekday_text)).get(day_name)
         
         if not matching_line:
             return (None, 'low', 'weekday_text_no_match')
         
+        lower = matching_line.lower()
+
         # Check for "Closed"
-        if 'Closed' in matching_line or 'closed' in matching_line:
+        if 'closed' in lower:
             return (False, 'medium', 'weekday_text_closed')
         
         # Check for "Open 24 hours"
-        if '24 hours' in matching_line or 'Open 24 hours' in matching_line:
+        if '24 hours' in lower:
             return (True, 'medium', 'weekday_text_24h')
         
         # Try to parse hours (basic parsing, not bullet-proof)
@@ -210,52 +264,7 @@ def daypart_category_modifier(daypart, category, mode, theme):
     # Get category metadata
     metadata = get_category_metadata(category)
     
-    # Base modifiers by daypart and category
-    modifiers = {
-        'morning': {
-            'cafe': 1.5,
-            'bakery': 1.3,
-            'park': 1.2,
-            'fitness': 1.0,
-            'bar': -2.5,
-            'nightclub': -3.0,
-            'nightlife': -2.0,
-        },
-        'midday': {
-            'restaurant': 1.2,
-            'casual_dining': 1.3,
-            'cafe': 1.0,
-            'museum': 1.1,
-            'shopping': 1.0,
-            'bar': -1.5,
-            'nightclub': -3.0,
-        },
-        'afternoon': {
-            'cafe': 1.2,
-            'park': 1.1,
-            'gallery': 1.0,
-            'shopping': 1.0,
-            'nightclub': -2.5,
-        },
-        'evening': {
-            'restaurant': 1.5,
-            'bar': 1.2,
-            'viewpoint': 1.1,
-            'performance': 1.3,
-            'nightclub': -0.5,  # Still early for clubs
-        },
-        'late': {
-            'bar': 1.0,
-            'nightclub': 0.5,
-            'nightlife': 1.0,
-            'restaurant': -1.0,
-            'cafe': -2.0,
-            'museum': -3.0,
-            'park': -2.0,
-        },
-    }
-    
-    base_modifier = modifiers.get(daypart, {}).get(category, 0.0)
+    base_modifier = _DAYPART_MODIFIERS.get((daypart, category), 0.0)
     
     # Theme-specific overrides
     if theme == 'night_vibe' and mode == 'date':
@@ -295,17 +304,13 @@ def calculate_slot_time(plan, slot_index, previous_stops=None):
     Returns:
         datetime: estimated start time in local timezone
     """
-    from datetime import datetime, timedelta
-    import pytz
-    
     # Get plan start time
     start_time = plan.start_time_utc
-    timezone_str = plan.inputs_json.get('timezone', 'UTC')
+    timezone_str = (plan.inputs_json.get('timezone') or 'UTC').strip()
     
     try:
-        tz = pytz.timezone(timezone_str)
-        dt_local = start_time.astimezone(tz)
-    except Exception:
+        dt_local = start_time.astimezone(get_timezone(timezone_str))
+    except UNKNOWN_TIMEZONE_ERRORS:
         dt_local = start_time
     
     if slot_index == 0 or not previous_stops:
@@ -1,16 +1,23 @@
 import logging
 from decimal import Decimal
+from functools import lru_cache
 from typing import Any, Dict, Optional
 import traceback
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from zoneinfo import ZoneInfo
 
-import pytz
+import orjson
 from celery import shared_task
+from celery.signals import worker_process_init
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
 
-from .models import Plan, Stop, Leg
+from .models import Plan, Stop, Leg, StopFeedback, StopHistory
+from .timezones import UNKNOWN_TIMEZONE_ERRORS, get_timezone
 
 from .engineV3.engine import V3PlannerEngine
 from .engineV3.llm import SlotLLM
@@ -21,6 +28,12 @@ from .engineV3.providers.google_directions_provider import build_google_directio
 
 logger = logging.getLogger(__name__)
 
+DIRECTION_MODES = ("walk", "bike", "drive")
+DIRECTIONS_MAX_WORKERS = 12
+
+# Frames kept in last_error_context["traceback"]
+TRACEBACK_FRAMES = 20
+
 
 def safe_cache_incr(key, delta=1, default=0):
     """
@@ -35,34 +48,70 @@ def safe_cache_incr(key, delta=1, default=0):
         return default + delta
 
 
+def record_plan_metrics(**deltas) -> None:
+    """
+    Add deltas to the metrics:<name> counters.
+
+    On Redis every INCRBY goes out in one pipeline (INCRBY creates missing
+    keys, so no exists/set round-trips); other backends use safe_cache_incr.
+    Metrics must never fail the task, so errors are only logged.
+    """
+    try:
+        backend = caches["default"]
+        if isinstance(backend, RedisCache):
+            pipe = backend._cache.get_client(write=True).pipeline(transaction=False)
+            for name, delta in deltas.items():
+                pipe.incrby(backend.make_and_validate_key(f"metrics:{name}"), delta)
+            pipe.execute()
+        else:
+            for name, delta in deltas.items():
+                safe_cache_incr(f"metrics:{name}", delta)
+    except Exception as e:
+        logger.warning(f"Failed to record plan metrics {list(deltas)}: {e}")
+
+
 import datetime
 import uuid
 from decimal import Decimal
 
 
-def make_json_safe(obj):
-    """
-    Recursively convert obj to JSON-serializable types:
-    - datetime/date/time → isoformat
-    - Decimal → float
-    - UUID → str
-    - set/tuple → list
-    - dict/list → recurse
-    - Pydantic → model_dump if present
-    """
-    if obj is None:
-        return None
+_PRIMITIVE_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
+def _is_flat(container) -> bool:
+    """True if a plain dict/list holds only primitives (and str keys)"""
+    if type(container) is dict:
+        return all(type(k) is str and type(v) in _PRIMITIVE_TYPES for k, v in container.items())
+    return all(type(v) in _PRIMITIVE_TYPES for v in container)
+
+
+def _isoformat(obj):
+    try:
+        return obj.isoformat()
+    except Exception:
+        return str(obj)
 
-    # Pydantic v2
-    if hasattr(obj, "model_dump"):
-        return make_json_safe(obj.model_dump())
 
+# Exact-type converters for the common leaves; anything else (subclasses,
+# unknown objects) goes through _json_safe_scalar's isinstance checks.
+_SCALAR_DISPATCH = {
+    datetime.datetime: _isoformat,
+    datetime.date: _isoformat,
+    datetime.time: _isoformat,
+    Decimal: float,
+    uuid.UUID: str,
+}
+
+
+@lru_cache(maxsize=None)
+def _has_model_dump(cls) -> bool:
+    return hasattr(cls, "model_dump")
+
+
+def _json_safe_scalar(obj):
     # datetime-like
     if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
-        try:
-            return obj.isoformat()
-        except Exception:
-            return str(obj)
+        return _isoformat(obj)
 
     if isinstance(obj, Decimal):
         return float(obj)
@@ -70,13 +119,7 @@ def make_json_safe(obj):
     if isinstance(obj, uuid.UUID):
         return str(obj)
 
-    if isinstance(obj, dict):
-        return {str(k): make_json_safe(v) for k, v in obj.items()}
-
-    if isinstance(obj, (list, tuple, set)):
-        return [make_json_safe(x) for x in obj]
-
-    # primitives
+    # primitives (subclasses, e.g. str enums)
     if isinstance(obj, (str, int, float, bool)):
         return obj
 
@@ -84,6 +127,106 @@ def make_json_safe(obj):
     return str(obj)
 
 
+def _orjson_default(obj):
+    """orjson fallback for the types it doesn't encode natively"""
+    if _has_model_dump(type(obj)):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return _json_safe_scalar(obj)
+
+
+def make_json_safe(obj):
+    """
+    Convert obj to JSON-serializable types (see _make_json_safe_py).
+
+    Round-trips through orjson, which encodes datetimes/UUIDs in C and is
+    much faster on the large metadata blobs. Anything orjson rejects
+    (non-str keys, ints over 64 bits, tz-aware times...) goes through the
+    pure-Python walker instead, so results match it.
+    """
+    if type(obj) in _PRIMITIVE_TYPES:
+        return obj
+    try:
+        return orjson.loads(orjson.dumps(
+            obj, default=_orjson_default, option=orjson.OPT_PASSTHROUGH_DATACLASS,
+        ))
+    except orjson.JSONEncodeError:
+        return _make_json_safe_py(obj)
+
+
+def _make_json_safe_py(obj):
+    """
+    Convert obj to JSON-serializable types:
+    - datetime/date/time → isoformat
+    - Decimal → float
+    - UUID → str
+    - set/tuple → list
+    - dict/list → walk children
+    - Pydantic → model_dump if present
+
+    Walks containers with an explicit stack (no recursion limit on deep
+    LLM JSON). Plain dicts/lists that are already all-primitive are
+    returned as-is; common leaf types are converted via _SCALAR_DISPATCH.
+    """
+    if type(obj) in _PRIMITIVE_TYPES:
+        return obj
+
+    root = [None]
+    stack = [(root, 0, obj)]
+    while stack:
+        parent, key, value = stack.pop()
+
+        if type(value) in _PRIMITIVE_TYPES:
+            parent[key] = value
+            continue
+
+        convert = _SCALAR_DISPATCH.get(type(value))
+        if convert is not None:
+            parent[key] = convert(value)
+            continue
+
+        # Pydantic v2
+        while _has_model_dump(type(value)):
+            value = value.model_dump()
+
+        if isinstance(value, dict):
+            if type(value) is dict and _is_flat(value):
+                parent[key] = value
+                continue
+            out = {}
+            children = []
+            for k, v in value.items():
+                k = str(k)
+                if type(v) in _PRIMITIVE_TYPES:
+                    out[k] = v
+                else:
+                    out[k] = None
+                    children.append((out, k, v))
+            parent[key] = out
+        elif isinstance(value, (list, tuple, set)):
+            if type(value) is list and _is_flat(value):
+                parent[key] = value
+                continue
+            out = []
+            children = []
+            for i, v in enumerate(value):
+                if type(v) in _PRIMITIVE_TYPES:
+                    out.append(v)
+                else:
+                    out.append(None)
+                    children.append((out, i, v))
+            parent[key] = out
+        else:
+            parent[key] = _json_safe_scalar(value)
+            continue
+
+        # Reverse so children are filled in order (later duplicate keys win)
+        stack.extend(reversed(children))
+
+    return root[0]
+
+
 def _to_decimal(x: Any) -> Decimal:
     if x is None:
         return Decimal("0")
@@ -92,12 +235,12 @@ def _to_decimal(x: Any) -> Decimal:
     return Decimal(str(x))
 
 
-def _get_tz(inputs: Dict[str, Any]) -> pytz.BaseTzInfo:
+def _get_tz(inputs: Dict[str, Any]) -> ZoneInfo:
     tz_str = (inputs.get("timezone") or "Europe/Berlin").strip()
     try:
-        return pytz.timezone(tz_str)
-    except Exception:
-        return pytz.timezone("Europe/Berlin")
+        return get_timezone(tz_str)
+    except UNKNOWN_TIMEZONE_ERRORS:
+        return get_timezone("Europe/Berlin")
 
 
 def _validate_inputs(inputs: Dict[str, Any]) -> None:
@@ -109,10 +252,28 @@ def _validate_inputs(inputs: Dict[str, Any]) -> None:
         raise ValueError("inputs_json missing user_location/current_location with lat/lng")
 
 
+# Providers and the OpenAI client hold no per-task state, so each worker
+# process builds them once. Cleared on worker_process_init so a forked child
+# never reuses the parent's HTTP connection pool.
+_shared_clients: Dict[str, Any] = {}
+
+
+def _shared_client(name: str, factory):
+    client = _shared_clients.get(name)
+    if client is None:
+        client = _shared_clients[name] = factory()
+    return client
+
+
+@worker_process_init.connect
+def _reset_shared_clients(**kwargs) -> None:
+    _shared_clients.clear()
+
+
 def _build_engine(inputs: Dict[str, Any]) -> V3PlannerEngine:
     """Build V3 engine with providers + optional LLM"""
-    places = build_google_places_provider()
-    weather = build_weather_provider()
+    places = _shared_client("places", build_google_places_provider)
+    weather = _shared_client("weather", build_weather_provider)
 
     providers = V3Providers(
         places=places,
@@ -128,7 +289,7 @@ def _build_engine(inputs: Dict[str, Any]) -> V3PlannerEngine:
     if use_llm:
         try:
             from openai import OpenAI
-            client = OpenAI()
+            client = _shared_client("openai", OpenAI)
             logger.info("LLM enabled: using OpenAI")
         except Exception as e:
             logger.warning(f"LLM client creation failed: {e}. Using fallback.")
@@ -138,10 +299,13 @@ def _build_engine(inputs: Dict[str, Any]) -> V3PlannerEngine:
     engine = V3PlannerEngine(providers=providers, llm=llm)
 
     # Attach directions provider for leg-building
-    engine._directions_provider = build_google_directions_provider()
+    engine._directions_provider = _shared_client("directions", build_google_directions_provider)
     return engine
 
 
+_OPEN_CONFIDENCES = frozenset({"high", "medium", "low"})
+
+
 def _derive_open_confidence(open_status: Optional[bool], open_conf: Optional[str]) -> str:
     """
     Model allows '' as default/unknown.
@@ -150,11 +314,81 @@ def _derive_open_confidence(open_status: Optional[bool], open_conf: Optional[str
     """
     if open_status is None:
         return ""
-    if open_conf in ("high", "medium", "low"):
+    if type(open_conf) is str and open_conf in _OPEN_CONFIDENCES:
         return open_conf
     return "low"
 
 
+def _clear_plan_results(plan_id) -> None:
+    """
+    Delete a plan's stops and legs with plain DELETE statements.
+
+    Stop/Leg have no delete signals, so the ORM collector (SELECT of every
+    row plus per-table deletes) is skipped. Rows cascading from Stop are
+    removed first so the FK constraints hold.
+    """
+    using = Plan.objects.db
+    StopFeedback.objects.filter(stop__plan_id=plan_id)._raw_delete(using)
+    StopHistory.objects.filter(stop__plan_id=plan_id)._raw_delete(using)
+    Leg.objects.filter(plan_id=plan_id)._raw_delete(using)
+    Stop.objects.filter(plan_id=plan_id)._raw_delete(using)
+
+
+def _fetch_leg_directions(directions_provider, coords) -> list:
+    """
+    Fetch walk/bike/drive directions for every consecutive pair of coords.
+    Cached routes are read in one get_many; the remaining (leg, mode)
+    requests run concurrently. Returns one modes_json per leg.
+    """
+    pairs = list(zip(coords, coords[1:]))
+    # Pre-seed keys so modes_json keeps walk/bike/drive order whatever finishes first
+    modes_by_leg = [dict.fromkeys(DIRECTION_MODES) for _ in pairs]
+    pending = [
+        (i, mode, origin, dest)
+        for i, (origin, dest) in enumerate(pairs)
+        for mode in DIRECTION_MODES
+    ]
+
+    cache_key = getattr(directions_provider, "cache_key", None)
+    if pending and cache_key is not None:
+        keys = [
+            cache_key(origin=origin, destination=dest, mode=mode, language="es")
+            for _, mode, origin, dest in pending
+        ]
+        cached = cache.get_many(keys)
+        misses = []
+        for key, req in zip(keys, pending):
+            if key in cached:
+                modes_by_leg[req[0]][req[1]] = cached[key]
+            else:
+                misses.append(req)
+        pending = misses
+
+    if not pending:
+        return modes_by_leg
+
+    with ThreadPoolExecutor(max_workers=min(DIRECTIONS_MAX_WORKERS, len(pending))) as executor:
+        futures = {
+            executor.submit(
+                directions_provider.get_directions,
+                origin=origin,
+                destination=dest,
+                mode=mode,
+                language="es",
+            ): (i, mode)
+            for i, mode, origin, dest in pending
+        }
+        for future in as_completed(futures):
+            i, mode = futures[future]
+            try:
+                modes_by_leg[i][mode] = future.result()
+            except Exception as e:
+                logger.warning(f"    Directions failed for {mode}: {e}")
+                modes_by_leg[i][mode] = {"distance_m": 0, "duration_sec": 0, "polyline": None}
+
+    return modes_by_leg
+
+
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={"max_retries": 3})
 def generate_plan_task(self, plan_id: str) -> bool:
     """
@@ -172,9 +406,14 @@ def generate_plan_task(self, plan_id: str) -> bool:
     start_time = time.time()
     logger.info(f"    V3 generate_plan_task START plan_id={plan_id}")
 
+    inputs: Dict[str, Any] = {}
     try:
-        plan = Plan.objects.get(id=plan_id)
-        inputs: Dict[str, Any] = plan.inputs_json or {}
+        # Only what the task reads; every other column it writes is set
+        # explicitly and saved with update_fields.
+        plan = Plan.objects.only(
+            "id", "inputs_json", "start_time_utc", "end_time_utc", "llm_attempts",
+        ).get(id=plan_id)
+        inputs = plan.inputs_json or {}
 
         # Validate
         _validate_inputs(inputs)
@@ -182,8 +421,12 @@ def generate_plan_task(self, plan_id: str) -> bool:
         tz = _get_tz(inputs)
         dt_local = plan.start_time_utc.astimezone(tz)
 
-        city_name = inputs.get("city_name") or inputs.get("city")
+        city_name = (inputs.get("city_name") or inputs.get("city") or "").strip()
         user_location = inputs.get("user_location") or inputs.get("current_location")
+        intent = inputs.get("intent") or "chill"
+        subtypes = inputs.get("intent_subtype") or []
+        constraints = inputs.get("constraints") or []
+        when_sel = inputs.get("when_selection") or "now"
 
         logger.info(f"    Plan {plan_id}: city={city_name}, dt={dt_local.isoformat()}")
 
@@ -207,13 +450,13 @@ def generate_plan_task(self, plan_id: str) -> bool:
         energy_str = "low" if energy_level <= 1 else ("high" if energy_level >= 2 else "medium")
         
         logger.info(f"    Plan duration: {duration_hours:.1f}h, energy: {energy_str}")
-        logger.info(f"    Generating plan with intent={inputs.get('intent')}...")
+        logger.info(f"    Generating plan with intent={intent}...")
         result = engine.generate(
             inputs={
-                "intent": inputs.get("intent") or "chill",
-                "when_selection": inputs.get("when_selection") or "now",
+                "intent": intent,
+                "when_selection": when_sel,
                 "discovery_mode": inputs.get("discovery_mode") or "local",
-                "constraints": inputs.get("constraints") or [],
+                "constraints": constraints,
                 "city_name": city_name,
                 "user_location": user_location,
                 "energy": energy_level,  # ← FIXED: pass energy
@@ -230,11 +473,192 @@ def generate_plan_task(self, plan_id: str) -> bool:
 
         logger.info(f"    Plan generated: {len(result.chosen_stops)} stops, {len(result.slots)} slots")
 
+        # ========== Calculate city_dna & guide BEFORE saving metadata ==========
+        # 1) City DNA (SlotLLM.get_city_dna caches it per process and in Django cache for 30 days)
+        logger.info(f"    Getting City DNA for {city_name}...")
+        city_dna = engine.llm.get_city_dna(city=city_name, language="es")
+        logger.info(f"    City DNA: {len(city_dna.get('food_typicals', []))} foods, {len(city_dna.get('drink_typicals', []))} drinks")
+
+        # 2) Build options_by_slot (for guide + presentation endpoint)
+        options_by_slot = [
+            {
+                "slot_id": slot.get("slot_id"),
+                "options": [
+                    {
+                        "place_id": (p := opt.get("place") or {}).get("place_id"),
+                        "name": p.get("name"),
+                        "category": p.get("category"),
+                        "rating": p.get("rating"),
+                        "distance_m": opt.get("distance_m"),
+                        "open": opt.get("open"),
+                        "open_confidence": opt.get("open_confidence"),
+                        "photo_reference": p.get("photo_reference"),  # ✅ AÑADIDO
+                    }
+                    for opt in (slot.get("options") or [])
+                ],
+            }
+            for slot in (result.slots or [])
+        ]
+
+        # 3) LLM local guide (qué pedir / típico / tips clima)
+        logger.info(f"    Building local guide...")
+        guide = engine.llm.build_local_guide(
+            city_dna=city_dna,
+            intent=intent,
+            subtypes=subtypes,
+            weather=weather_snapshot,
+            options_by_slot=options_by_slot,
+            constraints=constraints,
+            language="es",
+        )
+        logger.info(f"    Guide: {guide.get('headline')}")
+
+        # 4) Assemble the v3 metadata (with city_dna + guide included!); it is
+        # merged into the row's current metadata under the lock below.
+        # One make_json_safe pass converts every part, except options_by_slot:
+        # it only holds values copied from the provider JSON above, so it is
+        # attached after conversion.
+        v3_meta = make_json_safe({
+            "slots": result.slots,
+            "debug": result.debug,
+            "city_dna": city_dna,
+            "guide": guide,
+        })
+        v3_meta["options_by_slot"] = options_by_slot
+
+        # ========== Create stops with COMPACT order_index ==========
+        stops_to_create = []
+        idx = 0
+
+        for st in (result.chosen_stops or []):
+            # Ensure required coords exist
+            if st.get("lat") is None or st.get("lng") is None:
+                logger.warning(f"    Skipping stop without coordinates: {st.get('name')}")
+                continue
+
+            start_utc = st["start"].astimezone(datetime.timezone.utc)
+
+            why_now_long = str(st.get("why_now") or "").strip()
+            why_now_short = (why_now_long[:50] or None)
+
+            open_status = st.get("open_status")  # True/False/None
+            open_conf = _derive_open_confidence(open_status, st.get("open_confidence"))
+
+            stop = Stop(
+                plan=plan,
+                order_index=idx,
+                place_provider="google",
+                place_id=str(st.get("place_id")),
+                name=str(st.get("name") or ""),
+
+                lat=_to_decimal(st.get("lat")),
+                lng=_to_decimal(st.get("lng")),
+
+                category=str(st.get("category") or "other"),
+                tags=[],
+
+                start_time_utc=start_utc,
+                duration_min=int(st.get("duration_min") or 45),
+
+                priority="nice",
+                reason_short=why_now_long,
+                ai_reasoning=why_now_long,
+
+                # Optional signals
+                is_indoor=None,
+                price_level=None,
+                rating=st.get("rating"),
+                queue_score=1,
+                crowd_score=1,
+                noise_level=1,
+                is_tourist_trap=False,
+                local_favorite=False,
+                closing_time=None,
+                peak_hours=[],
+                rank_in_cluster=0,
+
+                # Opening hours + status
+                business_status=st.get("business_status"),
+                opening_hours_json=st.get("opening_hours_json"),
+                open_status_at_planned_time=open_status,
+                open_confidence=open_conf,
+                open_status_reason=st.get("open_reason"),
+
+                place_types=st.get("place_types"),
+                popularity=st.get("popularity"),
+                photo_reference=st.get("photo_reference"),
+
+                why_now=why_now_short,
+                score_breakdown={
+                    "engine": "v3",
+                    "slot_id": st.get("slot_id"),
+                    "slot_title": st.get("slot_title"),
+                },
+
+                when_selection=when_sel,
+                slot_role=st.get("slot_role"),
+
+                closed_warning=(open_status is False),
+                closed_reason=(st.get("open_reason") or "") if open_status is False else "",
+                hours_unknown=(open_status is None),
+            )
+
+            stops_to_create.append(stop)
+            idx += 1
+
+        # ========== Create legs between consecutive stops ==========
+        modes_by_leg = _fetch_leg_directions(
+            engine._directions_provider,
+            [(float(s.lat), float(s.lng)) for s in stops_to_create],
+        )
+
+        no_walk = "no_walk" in constraints
+        legs_to_create = []
+        for a, b, modes_json in zip(stops_to_create, stops_to_create[1:], modes_by_leg):
+
+            walk_dist = modes_json.get("walk", {}).get("distance_m", 0) or 0
+
+            # Recommended mode logic
+            if no_walk:
+                recommended_mode = "drive"
+            elif walk_dist and walk_dist <= 1500:
+                recommended_mode = "walk"
+            else:
+                recommended_mode = "drive"
+            recommended = modes_json.get(recommended_mode, {})
+
+            legs_to_create.append(Leg(
+                plan=plan,
+                from_stop=a,
+                to_stop=b,
+                modes_json=modes_json,
+                recommended_mode=recommended_mode,
+                recommended_distance_m=int(recommended.get("distance_m", 0) or 0),
+                recommended_duration_sec=int(recommended.get("duration_sec", 0) or 0),
+                recommended_reason="Auto (V3 core)",
+                ai_pick_reason="",
+                travel_warning="",
+            ))
+
         # ========== CRITICAL: Save everything in transaction ==========
+        # Only DB writes happen here: all provider/LLM I/O is done above, so the
+        # plan row lock (taken by the select_for_update below, which also
+        # serializes concurrent rebuilds) is held for milliseconds.
         with transaction.atomic():
-            plan = Plan.objects.select_for_update().get(id=plan_id)
-
-            plan.status = "building"
+            # Re-read the metadata under the row lock so keys patched while the
+            # task ran (pause/resume/archive) survive the write below.
+            meta = (
+                Plan.objects.select_for_update()
+                .only("optimization_metadata")
+                .get(id=plan_id)
+                .optimization_metadata
+            ) or {}
+            meta["v3"] = {**(meta.get("v3") or {}), **v3_meta}
+            plan.optimization_metadata = meta
+
+            # Nothing inside the transaction is visible before commit, so the
+            # plan goes straight to "ready" in its one UPDATE.
+            plan.status = "ready"
             plan.last_error_code = None
             plan.last_error_context = None
             plan.weather_snapshot_json = make_json_safe(weather_snapshot)
@@ -242,7 +666,7 @@ def generate_plan_task(self, plan_id: str) -> bool:
             # Track generation method
             if inputs.get("use_llm"):
                 plan.generation_method = "llm"
-                plan.llm_attempts = (plan.llm_attempts or 0) + 1
+                plan.llm_attempts = F("llm_attempts") + 1
             else:
                 plan.generation_method = "fallback"
 
@@ -253,230 +677,52 @@ def generate_plan_task(self, plan_id: str) -> bool:
                 "weather_snapshot_json",
                 "generation_method",
                 "llm_attempts",
+                "optimization_metadata",
             ])
 
-            # Clear old results
-            plan.stops.all().delete()
-            plan.legs.all().delete()
-
-            # ========== FIX: Calculate city_dna & guide BEFORE saving metadata ==========
-            meta = plan.optimization_metadata or {}
-            v3 = meta.get("v3") or {}
-
-            # 1) City DNA (cached 30 days)
-            logger.info(f"    Getting City DNA for {city_name}...")
-            city_name_clean = (city_name or "").strip()
-            city_dna = engine.llm.get_city_dna(city=city_name_clean, language="es")
-            logger.info(f"    City DNA: {len(city_dna.get('food_typicals', []))} foods, {len(city_dna.get('drink_typicals', []))} drinks")
-
-            # 2) Guardar slots/debug
-            v3["slots"] = make_json_safe(result.slots)
-            v3["debug"] = make_json_safe(result.debug)
-            v3["city_dna"] = make_json_safe(city_dna)
-
-            # 3) Build options_by_slot (for guide + presentation endpoint)
-            options_by_slot = []
-            for slot in (result.slots or []):
-                slot_id = slot.get("slot_id")
-                opts = []
-                for opt in (slot.get("options") or []):
-                    p = opt.get("place") or {}
-                    opts.append({
-                        "place_id": p.get("place_id"),
-                        "name": p.get("name"),
-                        "category": p.get("category"),
-                        "rating": p.get("rating"),
-                        "distance_m": opt.get("distance_m"),
-                        "open": opt.get("open"),
-                        "open_confidence": opt.get("open_confidence"),
-                        "photo_reference": p.get("photo_reference"),  # ✅ AÑADIDO
-                    })
-                options_by_slot.append({"slot_id": slot_id, "options": opts})
-
-            # 4) LLM local guide (qué pedir / típico / tips clima)
-            logger.info(f"    Building local guide...")
-            guide = engine.llm.build_local_guide(
-                city_dna=city_dna,
-                intent=(inputs.get("intent") or "chill"),
-                subtypes=(inputs.get("intent_subtype") or []),
-                weather=weather_snapshot,
-                options_by_slot=options_by_slot,
-                constraints=(inputs.get("constraints") or []),
-                language="es",
-            )
-            logger.info(f"    Guide: {guide.get('headline')}")
-
-            v3["guide"] = make_json_safe(guide)
-            v3["options_by_slot"] = make_json_safe(options_by_slot)
-
-            # 5) NOW save metadata (with city_dna + guide included!)
-            meta["v3"] = v3
-            plan.optimization_metadata = make_json_safe(meta)
-            plan.save(update_fields=["optimization_metadata"])
-
             logger.info(f"    Metadata saved (city_dna + guide included)")
 
-            # ========== Create stops with COMPACT order_index ==========
-            created_stops = []
-            idx = 0
-            
-            for st in (result.chosen_stops or []):
-                # Ensure required coords exist
-                if st.get("lat") is None or st.get("lng") is None:
-                    logger.warning(f"    Skipping stop without coordinates: {st.get('name')}")
-                    continue
-
-                start_utc = st["start"].astimezone(pytz.UTC)
-
-                why_now_long = str(st.get("why_now") or "").strip()
-                why_now_short = (why_now_long[:50] or None)
-
-                open_status = st.get("open_status")  # True/False/None
-                open_conf = _derive_open_confidence(open_status, st.get("open_confidence"))
-
-                stop = Stop.objects.create(
-                    plan=plan,
-                    order_index=idx,
-                    place_provider="google",
-                    place_id=str(st.get("place_id")),
-                    name=str(st.get("name") or ""),
-
-                    lat=_to_decimal(st.get("lat")),
-                    lng=_to_decimal(st.get("lng")),
-
-                    category=str(st.get("category") or "other"),
-                    tags=[],
-
-                    start_time_utc=start_utc,
-                    duration_min=int(st.get("duration_min") or 45),
-
-                    priority="nice",
-                    reason_short=why_now_long,
-                    ai_reasoning=why_now_long,
-
-                    # Optional signals
-                    is_indoor=None,
-                    price_level=None,
-                    rating=st.get("rating"),
-                    queue_score=1,
-                    crowd_score=1,
-                    noise_level=1,
-                    is_tourist_trap=False,
-                    local_favorite=False,
-                    closing_time=None,
-                    peak_hours=[],
-                    rank_in_cluster=0,
-
-                    # Opening hours + status
-                    business_status=st.get("business_status"),
-                    opening_hours_json=st.get("opening_hours_json"),
-                    open_status_at_planned_time=open_status,
-                    open_confidence=open_conf,
-                    open_status_reason=st.get("open_reason"),
-
-                    place_types=st.get("place_types"),
-                    popularity=st.get("popularity"),
-                    photo_reference=st.get("photo_reference"),
-
-                    why_now=why_now_short,
-                    score_breakdown={
-                        "engine": "v3",
-                        "slot_id": st.get("slot_id"),
-                        "slot_title": st.get("slot_title"),
-                    },
-
-                    when_selection=inputs.get("when_selection", "now"),
-                    slot_role=st.get("slot_role"),
-
-                    closed_warning=(open_status is False),
-                    closed_reason=(st.get("open_reason") or "") if open_status is False else "",
-                    hours_unknown=(open_status is None),
-                )
-
-                created_stops.append(stop)
-                idx += 1
+            # Clear old results
+            _clear_plan_results(plan.id)
 
+            created_stops = Stop.objects.bulk_create(stops_to_create)
             logger.info(f"    Created {len(created_stops)} stops")
 
-            # ========== Create legs between consecutive stops ==========
-            for i in range(len(created_stops) - 1):
-                a = created_stops[i]
-                b = created_stops[i + 1]
-
-                origin = (float(a.lat), float(a.lng))
-                dest = (float(b.lat), float(b.lng))
-
-                modes_json = {}
-                for mode in ["walk", "bike", "drive"]:
-                    try:
-                        modes_json[mode] = engine._directions_provider.get_directions(
-                            origin=origin,
-                            destination=dest,
-                            mode=mode,
-                            language="es",
-                        )
-                    except Exception as e:
-                        logger.warning(f"    Directions failed for {mode}: {e}")
-                        modes_json[mode] = {"distance_m": 0, "duration_sec": 0, "polyline": None}
-
-                walk_dist = modes_json.get("walk", {}).get("distance_m", 0) or 0
-                
-                # Recommended mode logic
-                if "no_walk" in (inputs.get("constraints") or []):
-                    recommended_mode = "drive"
-                elif walk_dist and walk_dist <= 1500:
-                    recommended_mode = "walk"
-                else:
-                    recommended_mode = "drive"
-
-                Leg.objects.create(
-                    plan=plan,
-                    from_stop=a,
-                    to_stop=b,
-                    modes_json=modes_json,
-                    recommended_mode=recommended_mode,
-                    recommended_distance_m=int(modes_json.get(recommended_mode, {}).get("distance_m", 0) or 0),
-                    recommended_duration_sec=int(modes_json.get(recommended_mode, {}).get("duration_sec", 0) or 0),
-                    recommended_reason="Auto (V3 core)",
-                    ai_pick_reason="",
-                    travel_warning="",
-                )
-
-            logger.info(f"    Created {len(created_stops) - 1} legs")
-
-            # ========== Plan ready ==========
-            plan.status = "ready"
-            plan.save(update_fields=["status"])
+            Leg.objects.bulk_create(legs_to_create)
+            logger.info(f"    Created {len(legs_to_create)} legs")
 
         # Metrics
         duration = time.time() - start_time
         logger.info(f"    V3 generate_plan_task SUCCESS plan_id={plan_id}, stops={len(created_stops)}, duration={duration:.2f}s")
         
         # Track metrics
-        safe_cache_incr('metrics:plan_generation_count', 1)
-        safe_cache_incr('metrics:plan_generation_time', int(duration))
+        record_plan_metrics(plan_generation_count=1, plan_generation_time=int(duration))
 
         return True
 
     except Exception as e:
         logger.error(f"    Plan {plan_id} FAILED: {e}", exc_info=True)
         
-        # Save error context
+        # Save error context (single UPDATE: no reload, no rewrite of the JSON columns)
         try:
-            plan = Plan.objects.get(id=plan_id)
-            plan.status = "failed"
-            plan.last_error_code = type(e).__name__
-            plan.last_error_context = {
-                "error": str(e),
-                "traceback": traceback.format_exc()[:2000],  # Limit size
-                "inputs": plan.inputs_json,
-            }
-            plan.save()
+            Plan.objects.filter(id=plan_id).update(
+                status="failed",
+                last_error_code=type(e).__name__,
+                last_error_context={
+                    "error": str(e),
+                    # Only the innermost frames, tail-trimmed so the error line survives
+                    "traceback": "".join(
+                        traceback.format_exception(type(e), e, e.__traceback__, limit=-TRACEBACK_FRAMES)
+                    )[-2000:],
+                    "inputs": inputs,
+                },
+                updated_at=timezone.now(),
+            )
         except Exception as save_error:
             logger.error(f"Failed to save error context: {save_error}")
         
         # Track failure
-        safe_cache_incr('metrics:plan_generation_failures', 1)
+        record_plan_metrics(plan_generation_failures=1)
         
         raise
 
@@ -496,14 +742,15 @@ def swap_stop_task(self, plan_id: str, stop_id: str, reason: str):
     """
     logger.info(f"    swap_stop_task: plan={plan_id}, stop={stop_id}, reason={reason}")
     
+    # batch_swap runs one task per item, several of which may share a plan:
+    # status is written with a single-column UPDATE, never a full-row save(),
+    # so concurrent swaps don't overwrite each other's changes.
     try:
-        plan = Plan.objects.get(id=plan_id)
-        stop = Stop.objects.get(id=stop_id, plan=plan)
+        stop = Stop.objects.only("id").get(id=stop_id, plan_id=plan_id)
         
         # TODO: Implement actual swap logic
         # For now, just mark plan as ready again
-        plan.status = "ready"
-        plan.save()
+        Plan.objects.filter(id=plan_id).update(status="ready", updated_at=timezone.now())
         
         logger.info(f"    Swap completed (stub)")
         return True
@@ -512,9 +759,8 @@ def swap_stop_task(self, plan_id: str, stop_id: str, reason: str):
         logger.error(f"    Swap failed: {e}", exc_info=True)
         
         try:
-            plan = Plan.objects.get(id=plan_id)
-            plan.status = "ready"  # Restore to ready
-            plan.save()
+            # Restore to ready
+            Plan.objects.filter(id=plan_id).update(status="ready", updated_at=timezone.now())
         except:
             pass
         
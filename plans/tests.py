@@ -0,0 +1,129 @@
+import importlib
+import sys
+import types
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from .models import Plan, Stop
+
+
+START = datetime(2026, 10, 15, 9, 0, tzinfo=timezone.utc)
+
+
+class PlanListTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("u", "u@example.com", "password123")
+        self.client.force_authenticate(self.user)
+
+    def make_plan(self, **kwargs):
+        return Plan.objects.create(
+            user=self.user,
+            status="ready",
+            start_time_utc=START,
+            end_time_utc=START + timedelta(hours=8),
+            inputs_json={"city_name": "Berlin", "timezone": "Europe/Berlin"},
+            **kwargs,
+        )
+
+    def test_list_is_newest_first(self):
+        plans = [self.make_plan() for _ in range(3)]
+        # Insert order and created_at deliberately disagree
+        for plan, days in zip(plans, (1, 3, 2)):
+            Plan.objects.filter(pk=plan.pk).update(created_at=START + timedelta(days=days))
+
+        response = self.client.get("/api/plans/")
+
+        self.assertEqual(response.status_code, 200)
+        ids = [str(row["id"]) for row in response.data["results"]]
+        self.assertEqual(ids, [str(plans[i].pk) for i in (1, 2, 0)])
+
+
+class PlanDetailTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("u", "u@example.com", "password123")
+        self.client.force_authenticate(self.user)
+        self.plan = Plan.objects.create(
+            user=self.user,
+            status="ready",
+            start_time_utc=START,
+            end_time_utc=START + timedelta(hours=8),
+            inputs_json={"city_name": "Berlin", "timezone": "Europe/Berlin"},
+        )
+        for i, is_open in enumerate((True, False, None)):
+            Stop.objects.create(
+                plan=self.plan, order_index=i, place_id=f"p{i}", name=f"Stop {i}",
+                lat=52.52, lng=13.40, category="cafe",
+                start_time_utc=START + timedelta(hours=i), duration_min=30,
+                open_status_at_planned_time=is_open,
+            )
+
+    def assert_open_labels(self, response):
+        self.assertEqual(response.status_code, 200)
+        labels = [stop["open_label"] for stop in response.data["stops"]]
+        self.assertEqual(labels, ["Open", "Closed", "Hours unknown"])
+
+    def test_retrieve_has_open_labels(self):
+        self.assert_open_labels(self.client.get(f"/api/plans/{self.plan.pk}/"))
+
+    def test_update_response_keeps_open_labels(self):
+        response = self.client.patch(
+            f"/api/plans/{self.plan.pk}/", {"status": "completed"}, format="json"
+        )
+        self.assert_open_labels(response)
+
+
+def _import_time_engine():
+    """
+    time_engine imports plans.constants.*, which isn't in this tree; only the
+    daypart scoring uses it, so stand-ins are enough for the periods logic.
+    """
+    dayparts = types.ModuleType("plans.constants.dayparts")
+    dayparts.get_daypart = lambda dt: None
+    categories = types.ModuleType("plans.constants.categories")
+    categories.get_category_metadata = lambda category: {}
+    with mock.patch.dict(sys.modules, {
+        "plans.constants": types.ModuleType("plans.constants"),
+        "plans.constants.dayparts": dayparts,
+        "plans.constants.categories": categories,
+    }):
+        return importlib.import_module("plans.services.engines.time_engine")
+
+
+class OpeningPeriodsTests(SimpleTestCase):
+    # Google periods: day 0 = Sunday, 6 = Saturday
+    SAT_NIGHT = [{"open": {"day": 6, "time": "2200"}, "close": {"day": 0, "time": "0300"}}]
+    SAT_TO_SUN = [{"open": {"day": 6, "time": "1900"}, "close": {"day": 0, "time": "2300"}}]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.time_engine = _import_time_engine()
+
+    def check(self, periods, dt_local, duration_min):
+        return self.time_engine._check_periods(periods, dt_local, duration_min)[:2]
+
+    def test_saturday_visit_running_into_sunday(self):
+        saturday = datetime(2026, 10, 17, 23, 0)
+        self.assertEqual(self.check(self.SAT_NIGHT, saturday, 120), (True, "high"))
+        self.assertEqual(self.check(self.SAT_NIGHT, saturday, 300), (False, "high"))
+
+    def test_sunday_continuation_of_saturday_period(self):
+        sunday = datetime(2026, 10, 18, 1, 0)
+        self.assertEqual(self.check(self.SAT_NIGHT, sunday, 60), (True, "high"))
+        self.assertEqual(self.check(self.SAT_NIGHT, sunday, 180), (False, "high"))
+
+    def test_continuation_visit_past_midnight_after_close(self):
+        # Ends Monday 00:00, after the 23:00 Sunday close
+        sunday = datetime(2026, 10, 18, 22, 0)
+        self.assertEqual(
+            self.time_engine._check_periods(self.SAT_TO_SUN, sunday, 120),
+            (False, "high", "closes_during_visit"),
+        )
+
+    def test_closed_outside_period(self):
+        friday = datetime(2026, 10, 16, 23, 0)
+        self.assertEqual(self.check(self.SAT_NIGHT, friday, 30), (False, "high"))
@@ -0,0 +1,15 @@
+"""
+Timezone lookup shared by views, serializers, tasks and engines
+"""
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# What get_timezone() raises for a name that isn't a usable IANA zone.
+# It never falls back on its own: callers pick their default.
+UNKNOWN_TIMEZONE_ERRORS = (ZoneInfoNotFoundError, ValueError, TypeError)
+
+
+@lru_cache(maxsize=256)
+def get_timezone(name):
+    """ZoneInfo for an IANA name, memoized per process"""
+    return ZoneInfo(name)
@@ -1,6 +1,11 @@
+from celery import group
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Max, Prefetch, Q, Value, When
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone as dj_timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
@@ -9,13 +14,23 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from datetime import timedelta
-
-from .models import Plan, Stop, StopFeedback, Profile, SavedPlace
+from functools import lru_cache
+from itertools import islice
+from types import MappingProxyType
+
+from .expressions import JSONMerge
+from .models import Plan, Stop, Leg, StopFeedback, Profile, SavedPlace
+from .renderers import stream_json_array
+from .timezones import UNKNOWN_TIMEZONE_ERRORS, get_timezone
 from .serializers import (
     PlanListSerializer,
     PlanDetailSerializer,
+    PlanStateSerializer,
     PlanCreateSerializer,
     SwapStopInputSerializer,
+    StopRefSerializer,
+    AdjustDurationInputSerializer,
+    BatchSwapInputSerializer,
     DelayInputSerializer,
     StopFeedbackSerializer,
     ProfileSerializer,
@@ -28,6 +43,27 @@ from .serializers import (
 from .tasks import generate_plan_task, swap_stop_task, delay_replan_task
 
 
+PHOTO_URL_TMPL = (
+    "https://maps.googleapis.com/maps/api/place/photo"
+    "?maxwidth=400&photo_reference={ref}&key={key}"
+)
+
+
+# generate(): inputs_json keys that fall back to a fixed literal when the
+# validated payload doesn't carry them
+_INPUTS_DEFAULTS = MappingProxyType({
+    "engine_version": "v3",
+    "llm_model": "gpt-4o-mini",
+    # Deprecated (V2 back-compat)
+    "mode": "travel",
+    "mood": "curious",
+    "energy": 2,
+    "social": 2,
+    "friction_tolerance": 2,
+    "budget": "normal",
+})
+
+
 class ProfileViewSet(viewsets.ModelViewSet):
     serializer_class = ProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -49,6 +85,7 @@ class PlanViewSet(viewsets.ModelViewSet):
       - GET    /api/plans/{id}/
       - GET    /api/plans/{id}/presentation/  ← NEW V3
       - POST   /api/plans/{id}/swap-stop/
+      - POST   /api/plans/batch-swap/
       - POST   /api/plans/{id}/delay/
       - POST   /api/plans/{id}/start/
       - POST   /api/plans/{id}/pause/
@@ -64,23 +101,117 @@ class PlanViewSet(viewsets.ModelViewSet):
 
     permission_classes = [permissions.IsAuthenticated]
 
+    # Actions that serialize the queryset rows directly and need the
+    # stops/legs prefetch. list and presentation get their own narrower
+    # querysets; custom mutations load the bare plan.
+    PREFETCH_ACTIONS = {"retrieve", "update", "partial_update"}
+    # Actions that only read scalar columns before the write; the JSON
+    # blobs can stay in the database.
+    LEAN_ACTIONS = {
+        "start", "complete", "lock_confidence", "unlock_confidence",
+        "swap_stop", "delay", "undo_swap", "remove_stop", "adjust_duration",
+        "pause", "resume", "archive",
+    }
+
     def get_queryset(self):
+        # DRF builds a view instance per request, so memoizing here only
+        # spares the repeated calls within a single request
+        qs = getattr(self, "_plan_qs", None)
+        if qs is None:
+            if self.action == "list":
+                qs = self._list_qs()
+            elif self.action == "presentation":
+                qs = self._presentation_qs()
+            elif self.action in self.PREFETCH_ACTIONS:
+                qs = self._detail_qs()
+            elif self.action in self.LEAN_ACTIONS:
+                qs = self._lean_qs()
+            else:
+                qs = Plan.objects.filter(user=self.request.user)
+            self._plan_qs = qs
+        return qs
+
+    def _lean_qs(self):
+        """Plans without the large JSON columns"""
+        return Plan.objects.filter(user=self.request.user).defer(
+            "inputs_json", "optimization_metadata", "weather_snapshot_json", "last_error_context",
+        )
+
+    def _list_qs(self):
+        """Just the columns PlanListSerializer reads, with the stop count in SQL"""
         return (
             Plan.objects.filter(user=self.request.user)
-            .prefetch_related("stops", "legs", "legs__from_stop", "legs__to_stop")
+            .only(
+                "id", "user", "status", "start_time_utc", "end_time_utc",
+                "route_quality_score", "clusters_visited", "inputs_json",
+                "created_at", "updated_at",
+            )
+            .annotate(stop_count=Count("stops"))
+            # The GROUP BY drops Meta.ordering; keep pagination stable
+            .order_by("-created_at", "-id")
         )
 
+    def _presentation_qs(self):
+        """Plan, stop and leg columns the presentation payload is built from"""
+        stops_qs = Stop.objects.only(
+            "id", "plan", "order_index", "place_id", "name", "category",
+            "lat", "lng", "rating", "photo_reference", "start_time_utc",
+            "duration_min", "why_now", "score_breakdown",
+            "open_status_at_planned_time", "open_confidence", "open_status_reason",
+        ).order_by("order_index")
+        legs_qs = Leg.objects.only(
+            "id", "plan", "from_stop", "to_stop", "modes_json", "recommended_mode",
+            "recommended_distance_m", "recommended_duration_sec",
+        ).order_by("from_stop__order_index")
+        return (
+            Plan.objects.filter(user=self.request.user)
+            .only(
+                "id", "status", "inputs_json", "optimization_metadata",
+                "weather_snapshot_json", "start_time_utc", "generation_method",
+            )
+            .prefetch_related(
+                Prefetch("stops", queryset=stops_qs),
+                Prefetch("legs", queryset=legs_qs),
+            )
+        )
+
+    def _detail_qs(self):
+        """Plans with everything PlanDetailSerializer walks prefetched"""
+        stops_qs = Stop.objects.annotate(
+            open_label=Case(
+                When(open_status_at_planned_time=True, then=Value("Open")),
+                When(open_status_at_planned_time=False, then=Value("Closed")),
+                default=Value("Hours unknown"),
+            )
+        ).order_by("order_index")
+        # Legs only ever expose from_stop_id/to_stop_id, so the stops they
+        # point at don't need loading. Ordering lives in the Prefetch so
+        # plan.stops.all() / plan.legs.all() come back in display order.
+        legs_qs = Leg.objects.order_by("from_stop__order_index")
+        return (
+            Plan.objects.filter(user=self.request.user)
+            .prefetch_related(
+                Prefetch("stops", queryset=stops_qs),
+                Prefetch("legs", queryset=legs_qs),
+            )
+        )
+
+    def _merge_meta(self, plan, patch, **fields):
+        """Merge keys into optimization_metadata (and set any plain columns) in one UPDATE"""
+        fields["updated_at"] = dj_timezone.now()
+        Plan.objects.filter(pk=plan.pk).update(
+            optimization_metadata=JSONMerge("optimization_metadata", patch),
+            **fields,
+        )
+        # Keep the in-memory instance in step for the response
+        for name, value in fields.items():
+            setattr(plan, name, value)
+
     def get_serializer_class(self):
         if self.action == "list":
             return PlanListSerializer
         return PlanDetailSerializer
 
-    def retrieve(self, request, pk=None):
-        """GET /api/plans/{id}/ - Full plan details"""
-        plan = self.get_object()
-        serializer = PlanDetailSerializer(plan)
-        return Response(serializer.data)
-
     @action(detail=False, methods=["post"])
     def generate(self, request):
         """
@@ -109,30 +240,20 @@ class PlanViewSet(viewsets.ModelViewSet):
         serializer = PlanCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
-        
-        # V3 requires coordinates
-        lat = data.get("lat")
-        lng = data.get("lng")
-        if lat is None or lng is None:
-            return Response(
-                {
-                    "error": "lat/lng required",
-                    "hint": "V3 needs current_location coordinates to query Google Places.",
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        lat = data["lat"]
+        lng = data["lng"]
+
         start_dt = data.get("start_time")
         
         end_dt = data.get("end_time")
         
         if not start_dt:
             # Fallback: calculate now in user's timezone
-            import pytz
             timezone_str = data.get('timezone', 'Europe/Berlin')
             try:
-                tz = pytz.timezone(timezone_str)
-            except:
-                tz = pytz.UTC
+                tz = get_timezone(timezone_str)
+            except UNKNOWN_TIMEZONE_ERRORS:
+                tz = get_timezone("UTC")
             
             from datetime import datetime, timedelta
             start_dt = datetime.now(tz)
@@ -178,28 +299,29 @@ class PlanViewSet(viewsets.ModelViewSet):
         # ✅ NEW: Extract timing data
         plan_ahead_hint = request.data.get("plan_ahead_hint", "")
         
-        # Build V3 inputs_json
-        constraints = list(data.get("constraints") or [])
+        # Build V3 inputs_json. Constraints are an ordered set: dict keys
+        # keep first-seen order and make the membership checks O(1).
+        constraints = dict.fromkeys(data.get("constraints") or [])
 
         # Back-compat: merge 'avoid' into constraints
         avoid = list(data.get("avoid") or [])
-        for a in avoid:
-            if a and a not in constraints:
-                constraints.append(a)
+        constraints.update(dict.fromkeys(a for a in avoid if a))
 
         # Back-compat: indoor/outdoor toggles
         indoor_ok = bool(data.get("indoor_ok", True))
         outdoor_ok = bool(data.get("outdoor_ok", True))
         if indoor_ok and not outdoor_ok:
-            if "indoor_only" not in constraints:
-                constraints.append("indoor_only")
+            constraints["indoor_only"] = None
         if outdoor_ok and not indoor_ok:
-            if "outdoor_only" not in constraints:
-                constraints.append("outdoor_only")
+            constraints["outdoor_only"] = None
+        constraints = list(constraints)
 
         inputs_json = {
+            # Static fallbacks, overridden by whatever the serializer carries
+            **_INPUTS_DEFAULTS,
+            **{k: data[k] for k in _INPUTS_DEFAULTS if k in data},
+
             # ========== V3 CORE ==========
-            "engine_version": data.get("engine_version", "v3"),
             "city_name": data.get("city_name") or request.data.get("city_name"),
             "timezone": data.get("timezone") or request.data.get("timezone", "Europe/Berlin"),
             
@@ -218,19 +340,12 @@ class PlanViewSet(viewsets.ModelViewSet):
             "energy_level": request.data.get("energy_level", "medium"),
             "constraints": constraints,
             "use_llm": bool(data.get("use_llm", False)),
-            "llm_model": data.get("llm_model", "gpt-4o-mini"),
             "companions": data.get("companions"),
             "current_location": {"lat": float(lat), "lng": float(lng)},
             "weather": data.get("weather"),  # Manual override for QA
 
             # ========== DEPRECATED (for back-compat) ==========
             "when_selection": request.data.get("when_selection", "now"),  # Old model
-            "mode": data.get("mode", "travel"),
-            "mood": data.get("mood", "curious"),
-            "energy": data.get("energy", 2),
-            "social": data.get("social", 2),
-            "friction_tolerance": data.get("friction_tolerance", 2),
-            "budget": data.get("budget", "normal"),
             "avoid": avoid,
             "indoor_ok": indoor_ok,
             "outdoor_ok": outdoor_ok,
@@ -256,9 +371,9 @@ class PlanViewSet(viewsets.ModelViewSet):
         )
        
        
-        # Trigger async generation
-        
-        generate_plan_task.delay(str(plan.id))
+        # Trigger async generation once the row is visible to workers
+        args = (str(plan.id),)
+        transaction.on_commit(lambda: generate_plan_task.delay(*args))
 
         # ✅ Response with timing context
         city_name = inputs_json.get('city_name', 'Unknown')
@@ -305,14 +420,16 @@ class PlanViewSet(viewsets.ModelViewSet):
         
         from django.conf import settings
 
+        api_key = getattr(settings, 'GOOGLE_PLACES_API_KEY', None)
+
+        # Per-request memo: a reference often shows up both as the selected
+        # stop and among its slot's options
+        @lru_cache(maxsize=128)
         def build_photo_url(photo_reference):
             """Convert Google photo_reference to full URL"""
-            if not photo_reference:
-                return None
-            api_key = getattr(settings, 'GOOGLE_PLACES_API_KEY', None)
-            if not api_key:
+            if not photo_reference or not api_key:
                 return None
-            return f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=400&photo_reference={photo_reference}&key={api_key}"
+            return PHOTO_URL_TMPL.format(ref=photo_reference, key=api_key)
         
             
         # Extract data
@@ -323,11 +440,9 @@ class PlanViewSet(viewsets.ModelViewSet):
         # Timezone handling
         timezone_str = inputs.get('timezone', 'Europe/Berlin')
         try:
-            import pytz
-            tz = pytz.timezone(timezone_str)
-        except:
-            import pytz
-            tz = pytz.UTC
+            tz = get_timezone(timezone_str)
+        except UNKNOWN_TIMEZONE_ERRORS:
+            tz = get_timezone("UTC")
         
         dt_local = plan.start_time_utc.astimezone(tz)
         weather = plan.weather_snapshot_json or {}
@@ -359,31 +474,21 @@ class PlanViewSet(viewsets.ModelViewSet):
         }
         
         # Timeline (from stops)
-        stops = plan.stops.all().order_by('order_index')
-        timeline = []
+        stops = plan.stops.all()
+        slot_ids = [s.score_breakdown.get('slot_id', f'slot_{s.order_index}') for s in stops]
+        photo_urls = [build_photo_url(s.photo_reference) for s in stops]
 
-        stop_photo_map = {}  # place_id -> photo_url
-        
-        for stop in stops:
-            # Get slot_id from score_breakdown
-            slot_id = stop.score_breakdown.get('slot_id', f'slot_{stop.order_index}')
-            slot_title = stop.score_breakdown.get('slot_title', stop.category)
-            
-            # Calculate end time
-            end_time = stop.start_time_utc + timedelta(minutes=stop.duration_min)
-            
-            # ✅ FIX: Build photo_url BEFORE using it
-            photo_url = build_photo_url(stop.photo_reference)
-            
-            # Cache for options_by_slot
-            if stop.place_id:
-                stop_photo_map[stop.place_id] = photo_url
-            
-            timeline.append({
+        # place_id -> photo_url, reused by options_by_slot
+        stop_photo_map = {s.place_id: url for s, url in zip(stops, photo_urls) if s.place_id}
+
+        # End times are computed in UTC before converting so DST shifts
+        # inside a stop don't skew them
+        timeline = [
+            {
                 "slot_id": slot_id,
-                "title": slot_title,
-                "start": stop.start_time_utc.astimezone(tz).isoformat(),
-                "end": end_time.astimezone(tz).isoformat(),
+                "title": stop.score_breakdown.get('slot_title', stop.category),
+                "start": (start_utc := stop.start_time_utc).astimezone(tz).isoformat(),
+                "end": (start_utc + timedelta(minutes=stop.duration_min)).astimezone(tz).isoformat(),
                 "why_now": stop.why_now or "",
                 "selected": {
                     "stop_id": str(stop.id),
@@ -393,30 +498,38 @@ class PlanViewSet(viewsets.ModelViewSet):
                     "lat": float(stop.lat),
                     "lng": float(stop.lng),
                     "rating": stop.rating,
-                    "photo_url": photo_url,  # ✅ Now defined
+                    "photo_url": photo_url,
                     "open_status_at_planned_time": stop.open_status_at_planned_time,
                     "open_confidence": stop.open_confidence or "",
                     "open_status_reason": stop.open_status_reason or ""
                 }
-            })
+            }
+            for stop, slot_id, photo_url in zip(stops, slot_ids, photo_urls)
+        ]
         
-        # Options by slot (from v3 metadata)
+        # Options by slot (from v3 metadata), at most 8 per slot
         slots_data = v3.get('slots') or []
+        slot_options = [
+            [(opt, opt.get('place') or {}) for opt in islice(slot.get('options') or (), 8)]
+            for slot in slots_data
+        ]
+
+        # One photo per (place_id, photo_reference): the selected stop's URL
+        # if we have it, otherwise built from the option's own reference
+        photo_by_pid = {}
+        for entries in slot_options:
+            for _, place in entries:
+                key = (place.get('place_id'), place.get('photo_reference'))
+                if key not in photo_by_pid:
+                    photo_by_pid[key] = stop_photo_map.get(key[0]) or build_photo_url(key[1])
+
         options_by_slot = []
         
-        for slot in slots_data:
+        for slot, entries in zip(slots_data, slot_options):
             slot_id = slot.get('slot_id')
-            opts = []
-            
-            for opt in (slot.get('options') or [])[:8]:
-                place = opt.get('place') or {}
-                place_id = place.get('place_id')
-                
-                # Get photo from cache or build from reference
-                photo_url = stop_photo_map.get(place_id) or build_photo_url(place.get('photo_reference'))
-                
-                opts.append({
-                    "place_id": place_id,
+            opts = [
+                {
+                    "place_id": place.get('place_id'),
                     "name": place.get('name'),
                     "category": place.get('category'),
                     "rating": place.get('rating'),
@@ -424,8 +537,10 @@ class PlanViewSet(viewsets.ModelViewSet):
                     "open": opt.get('open'),
                     "open_confidence": opt.get('open_confidence', ''),
                     "open_reason": opt.get('open_reason', ''),
-                    "photo_url": photo_url,  
-                })
+                    "photo_url": photo_by_pid[(place.get('place_id'), place.get('photo_reference'))],
+                }
+                for opt, place in entries
+            ]
             
             if opts:
                 options_by_slot.append({
@@ -435,19 +550,20 @@ class PlanViewSet(viewsets.ModelViewSet):
                 })
         
         # Map data
-        map_stops = []
-        for stop in stops:
-            map_stops.append({
+        map_stops = [
+            {
                 "stop_id": str(stop.id),
                 "name": stop.name,
                 "lat": float(stop.lat),
                 "lng": float(stop.lng),
-                "slot_id": stop.score_breakdown.get('slot_id', f'slot_{stop.order_index}'),
+                "slot_id": slot_id,
                 "category": stop.category
-            })
+            }
+            for stop, slot_id in zip(stops, slot_ids)
+        ]
         
         # Legs with all modes
-        legs = plan.legs.all().order_by('from_stop__order_index')
+        legs = plan.legs.all()
         map_legs = []
         
         for leg in legs:
@@ -500,10 +616,9 @@ class PlanViewSet(viewsets.ModelViewSet):
             )
 
         plan.status = "active"
-        plan.save()
+        plan.save(update_fields=["status", "updated_at"])
 
-        serializer = PlanDetailSerializer(plan)
-        return Response(serializer.data)
+        return Response(PlanStateSerializer(plan).data)
 
     @action(detail=True, methods=["post"], url_path="swap-stop")
     def swap_stop(self, request, pk=None):
@@ -515,12 +630,15 @@ class PlanViewSet(viewsets.ModelViewSet):
         stop_id = serializer.validated_data["stop_id"]
         reason = serializer.validated_data["reason"]
 
-        _stop = get_object_or_404(Stop, id=stop_id, plan=plan)
-
-        plan.status = "swapping"
-        plan.save()
+        # Stop-belongs-to-plan check and status flip in one UPDATE
+        updated = Plan.objects.filter(pk=plan.pk, stops__id=stop_id).update(
+            status="swapping", updated_at=dj_timezone.now()
+        )
+        if not updated:
+            raise Http404
 
-        swap_stop_task.delay(str(plan.id), str(stop_id), reason)
+        args = (str(plan.id), str(stop_id), reason)
+        transaction.on_commit(lambda: swap_stop_task.delay(*args))
 
         return Response(
             {
@@ -531,6 +649,43 @@ class PlanViewSet(viewsets.ModelViewSet):
             status=status.HTTP_202_ACCEPTED,
         )
 
+    @action(detail=False, methods=["post"], url_path="batch-swap")
+    def batch_swap(self, request):
+        """POST /api/plans/batch-swap/ - Replace several stops in one call"""
+        serializer = BatchSwapInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        swaps = serializer.validated_data["swaps"]
+
+        # Every (plan, stop) pair must belong to this user
+        pairs = {(s["plan_id"], s["stop_id"]) for s in swaps}
+        owned = set(
+            Stop.objects.filter(
+                plan__user=request.user,
+                plan_id__in={pid for pid, _ in pairs},
+                id__in={sid for _, sid in pairs},
+            ).values_list("plan_id", "id")
+        )
+        if not pairs <= owned:
+            raise Http404
+
+        plan_ids = sorted({str(pid) for pid, _ in pairs})
+        Plan.objects.filter(pk__in=plan_ids).update(status="swapping", updated_at=dj_timezone.now())
+
+        # One pipelined broker send for the whole batch
+        job = group(
+            [swap_stop_task.s(str(s["plan_id"]), str(s["stop_id"]), s["reason"]) for s in swaps]
+        )
+        transaction.on_commit(lambda: job.delay())
+
+        return Response(
+            {
+                "plan_ids": plan_ids,
+                "status": "swapping",
+                "message": "Swapping stops. Poll /plans/{id} for updates.",
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
     @action(detail=True, methods=["post"])
     def delay(self, request, pk=None):
         """POST /api/plans/{id}/delay/ - Delay plan start"""
@@ -541,12 +696,15 @@ class PlanViewSet(viewsets.ModelViewSet):
         stop_id = serializer.validated_data["stop_id"]
         delta_min = serializer.validated_data["delta_min"]
 
-        _stop = get_object_or_404(Stop, id=stop_id, plan=plan)
-
-        plan.status = "building"
-        plan.save()
+        # Stop-belongs-to-plan check and status flip in one UPDATE
+        updated = Plan.objects.filter(pk=plan.pk, stops__id=stop_id).update(
+            status="building", updated_at=dj_timezone.now()
+        )
+        if not updated:
+            raise Http404
 
-        delay_replan_task.delay(str(plan.id), str(stop_id), int(delta_min))
+        args = (str(plan.id), str(stop_id), int(delta_min))
+        transaction.on_commit(lambda: delay_replan_task.delay(*args))
 
         return Response(
             {
@@ -568,53 +726,40 @@ class PlanViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        meta = plan.optimization_metadata or {}
-        meta["paused"] = True
-        meta["paused_at"] = dj_timezone.now().isoformat()
-        plan.optimization_metadata = meta
-        plan.save()
+        self._merge_meta(plan, {"paused": True, "paused_at": dj_timezone.now().isoformat()})
 
-        serializer = PlanDetailSerializer(plan)
-        return Response(serializer.data)
+        return Response(PlanStateSerializer(plan).data)
 
     @action(detail=True, methods=["post"])
     def resume(self, request, pk=None):
         """POST /api/plans/{id}/resume/ - Resume paused plan"""
         plan = self.get_object()
 
-        meta = plan.optimization_metadata or {}
-        meta["paused"] = False
-        meta["resumed_at"] = dj_timezone.now().isoformat()
-        plan.optimization_metadata = meta
-        plan.save()
+        self._merge_meta(plan, {"paused": False, "resumed_at": dj_timezone.now().isoformat()})
 
-        serializer = PlanDetailSerializer(plan)
-        return Response(serializer.data)
+        return Response(PlanStateSerializer(plan).data)
 
     @action(detail=True, methods=["post"])
     def complete(self, request, pk=None):
         """POST /api/plans/{id}/complete/ - Mark plan complete"""
         plan = self.get_object()
         plan.status = "completed"
-        plan.save()
+        plan.save(update_fields=["status", "updated_at"])
 
-        serializer = PlanDetailSerializer(plan)
-        return Response(serializer.data)
+        return Response(PlanStateSerializer(plan).data)
 
     @action(detail=True, methods=["post"])
     def archive(self, request, pk=None):
         """POST /api/plans/{id}/archive/ - Archive plan"""
         plan = self.get_object()
 
-        meta = plan.optimization_metadata or {}
-        meta["archived"] = True
-        meta["archived_at"] = dj_timezone.now().isoformat()
-        plan.optimization_metadata = meta
-
+        fields = {}
         if plan.status not in ["completed", "failed"]:
-            plan.status = "completed"
+            fields["status"] = "completed"
 
-        plan.save()
+        self._merge_meta(
+            plan, {"archived": True, "archived_at": dj_timezone.now().isoformat()}, **fields
+        )
 
         return Response({"status": "archived", "plan_id": str(plan.id)})
 
@@ -622,33 +767,47 @@ class PlanViewSet(viewsets.ModelViewSet):
     def remove_stop(self, request, pk=None):
         """POST /api/plans/{id}/remove_stop/ - Remove stop from plan"""
         plan = self.get_object()
-        stop_id = request.data.get("stop_id")
-
-        stop = get_object_or_404(Stop, id=stop_id, plan=plan)
-        stop.delete()
+        serializer = StopRefSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        # Reorder remaining stops
-        remaining = plan.stops.all().order_by("order_index")
-        for i, s in enumerate(remaining):
-            s.order_index = i
-            s.save()
+        stop = (
+            Stop.objects.only("id", "order_index")
+            .filter(id=serializer.validated_data["stop_id"], plan=plan)
+            .first()
+        )
+        if stop is None:
+            raise Http404
+        removed_idx = stop.order_index
+
+        # Close the gap in two set-based UPDATEs. Postgres checks the
+        # (plan, order_index) unique constraint row by row, so a plain
+        # "order_index - 1" can collide depending on row visit order;
+        # flipping to negatives first keeps every intermediate state unique.
+        with transaction.atomic():
+            stop.delete()
+            Stop.objects.filter(plan=plan, order_index__gt=removed_idx).update(
+                order_index=-F("order_index")
+            )
+            Stop.objects.filter(plan=plan, order_index__lt=0).update(
+                order_index=-F("order_index") - 1
+            )
 
-        serializer = PlanDetailSerializer(plan)
-        return Response(serializer.data)
+        return Response({"plan_id": str(plan.id), "status": plan.status})
 
     @action(detail=True, methods=["post"])
     def adjust_duration(self, request, pk=None):
         """POST /api/plans/{id}/adjust_duration/ - Change stop duration"""
         plan = self.get_object()
-        stop_id = request.data.get("stop_id")
-        new_duration = request.data.get("duration_min")
+        serializer = AdjustDurationInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        stop = get_object_or_404(Stop, id=stop_id, plan=plan)
-        stop.duration_min = int(new_duration)
-        stop.save()
+        updated = Stop.objects.filter(id=serializer.validated_data["stop_id"], plan=plan).update(
+            duration_min=serializer.validated_data["duration_min"], updated_at=dj_timezone.now()
+        )
+        if not updated:
+            raise Http404
 
-        serializer = PlanDetailSerializer(plan)
-        return Response(serializer.data)
+        return Response({"plan_id": str(plan.id), "status": plan.status})
 
     @action(detail=True, methods=["post"])
     def lock_confidence(self, request, pk=None):
@@ -663,7 +822,7 @@ class PlanViewSet(viewsets.ModelViewSet):
 
         plan.confidence_locked = True
         plan.confidence_locked_at = dj_timezone.now()
-        plan.save()
+        plan.save(update_fields=["confidence_locked", "confidence_locked_at", "updated_at"])
 
         return Response(
             {"message": "Plan locked - no more suggestions", "confidence_locked": True}
@@ -676,7 +835,7 @@ class PlanViewSet(viewsets.ModelViewSet):
 
         plan.confidence_locked = False
         plan.confidence_locked_at = None
-        plan.save()
+        plan.save(update_fields=["confidence_locked", "confidence_locked_at", "updated_at"])
 
         return Response({"message": "Plan unlocked", "confidence_locked": False})
 
@@ -684,16 +843,12 @@ class PlanViewSet(viewsets.ModelViewSet):
     def undo_swap(self, request, pk=None):
         """POST /api/plans/{id}/undo_swap/ - Undo last swap"""
         plan = self.get_object()
-        stop_id = request.data.get("stop_id")
-
-        if not stop_id:
-            return Response(
-                {"error": "stop_id required"}, status=status.HTTP_400_BAD_REQUEST
-            )
+        serializer = StopRefSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        stop_id = serializer.validated_data["stop_id"]
 
-        try:
-            stop = Stop.objects.get(id=stop_id, plan=plan)
-        except Stop.DoesNotExist:
+        stop = Stop.objects.only("id", "previous_stop_data").filter(id=stop_id, plan=plan).first()
+        if stop is None:
             return Response({"error": "Stop not found"}, status=status.HTTP_404_NOT_FOUND)
 
         if not stop.previous_stop_data:
@@ -703,10 +858,11 @@ class PlanViewSet(viewsets.ModelViewSet):
             )
 
         plan.status = "swapping"
-        plan.save()
+        plan.save(update_fields=["status", "updated_at"])
 
         from .tasks import undo_swap_task
-        undo_swap_task.delay(str(plan.id), str(stop_id))
+        args = (str(plan.id), str(stop_id))
+        transaction.on_commit(lambda: undo_swap_task.delay(*args))
 
         return Response({"message": "Undoing swap.", "status": "swapping"})
 
@@ -730,7 +886,10 @@ class SavedPlaceViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return SavedPlace.objects.filter(user=self.request.user)
+        qs = getattr(self, "_saved_place_qs", None)
+        if qs is None:
+            qs = self._saved_place_qs = SavedPlace.objects.filter(user=self.request.user)
+        return qs
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -766,11 +925,12 @@ class SavedPlaceViewSet(viewsets.ModelViewSet):
                 {"error": "place_id required"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            saved_place = SavedPlace.objects.get(user=request.user, place_id=place_id)
-            return Response({"is_saved": True, "saved_place_id": saved_place.id})
-        except SavedPlace.DoesNotExist:
-            return Response({"is_saved": False, "saved_place_id": None})
+        saved_place_id = (
+            SavedPlace.objects.filter(user=request.user, place_id=place_id)
+            .values_list("id", flat=True)
+            .first()
+        )
+        return Response({"is_saved": saved_place_id is not None, "saved_place_id": saved_place_id})
 
     @action(detail=False, methods=["post"])
     def toggle(self, request):
@@ -781,28 +941,27 @@ class SavedPlaceViewSet(viewsets.ModelViewSet):
                 {"error": "place_id required"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            saved_place = SavedPlace.objects.get(user=request.user, place_id=place_id)
-            saved_place.delete()
+        deleted, _ = SavedPlace.objects.filter(user=request.user, place_id=place_id).delete()
+        if deleted:
             return Response(
                 {"is_saved": False, "saved_place": None, "message": "Place removed from saved"}
             )
-        except SavedPlace.DoesNotExist:
-            serializer = SavedPlaceCreateSerializer(
-                data=request.data, context={"request": request}
+
+        serializer = SavedPlaceCreateSerializer(
+            data=request.data, context={"request": request}
+        )
+        if serializer.is_valid():
+            saved_place = serializer.save()
+            output_serializer = SavedPlaceSerializer(saved_place)
+            return Response(
+                {
+                    "is_saved": True,
+                    "saved_place": output_serializer.data,
+                    "message": "Place saved",
+                },
+                status=status.HTTP_201_CREATED,
             )
-            if serializer.is_valid():
-                saved_place = serializer.save()
-                output_serializer = SavedPlaceSerializer(saved_place)
-                return Response(
-                    {
-                        "is_saved": True,
-                        "saved_place": output_serializer.data,
-                        "message": "Place saved",
-                    },
-                    status=status.HTTP_201_CREATED,
-                )
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=["post"])
     def mark_visited(self, request, pk=None):
@@ -810,16 +969,34 @@ class SavedPlaceViewSet(viewsets.ModelViewSet):
         saved_place = self.get_object()
         saved_place.visited = True
         saved_place.visited_at = dj_timezone.now()
-        saved_place.save()
+        saved_place.save(update_fields=["visited", "visited_at", "updated_at"])
         serializer = SavedPlaceSerializer(saved_place)
         return Response(serializer.data)
 
     @action(detail=False, methods=["get"])
     def for_map(self, request):
-        """GET /api/saved-places/for_map/ - Optimized for map display"""
+        """
+        GET /api/saved-places/for_map/ - Optimized for map display
+
+        The ETag is (row count, newest updated_at): inserts and edits move the
+        timestamp, deletes move the count. A matching If-None-Match gets a 304
+        without the rows being read.
+        """
         saved_places = self.get_queryset()
-        serializer = SavedPlaceListSerializer(saved_places, many=True)
-        return Response(serializer.data)
+        stamp = saved_places.aggregate(n=Count("id"), last=Max("updated_at"))
+        last = stamp["last"].timestamp() if stamp["last"] else 0
+        etag = quote_etag(f"{stamp['n']}-{last}")
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            fields = SavedPlaceListSerializer.Meta.fields
+            response = StreamingHttpResponse(
+                stream_json_array(saved_places.only(*fields), SavedPlaceListSerializer()),
+                content_type="application/json",
+            )
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 # ============================================
@@ -846,39 +1023,52 @@ def register(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    if User.objects.filter(username=username).exists():
+    # One round-trip for both uniqueness checks; username wins if both clash
+    taken = set(
+        User.objects.filter(Q(username=username) | Q(email=email))
+        .values_list("username", flat=True)
+    )
+
+    if username in taken:
         return Response(
             {"error": "Username already exists"},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    if User.objects.filter(email=email).exists():
+    if taken:
         return Response(
             {"error": "Email already exists"},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    user = User.objects.create_user(username=username, email=email, password=password)
+    # A concurrent signup can still take the username between the check and
+    # the insert; auth_user's unique index is the real guard
+    try:
+        with transaction.atomic():
+            user = User.objects.create_user(username=username, email=email, password=password)
+    except IntegrityError:
+        return Response(
+            {"error": "Username already exists"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
     refresh = RefreshToken.for_user(user)
+    access = refresh.access_token  # property builds a fresh token on every access
 
     return Response(
         {
             "message": "User created successfully",
             "user": {"id": user.id, "username": user.username, "email": user.email},
-            "tokens": {"refresh": str(refresh), "access": str(refresh.access_token)},
+            "tokens": {"refresh": str(refresh), "access": str(access)},
         },
         status=status.HTTP_201_CREATED,
     )
 
 
-@api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def feature_flags(request):
-    """GET /api/feature-flags/ - Available features"""
-    mode = request.GET.get("mode", "today")
-    
+# Feature flags are static per deploy, so the payload is built once at import
+_FEATURE_FLAGS_PAYLOAD = {
+    "engine_version": "v3",
     # V3 features
-    available_intents = [
+    "available_intents": [
         "chill",
         "shop_local",
         "museum",
@@ -888,31 +1078,36 @@ def feature_flags(request):
         "romantic_date",
         "coffee_hop",
         "culture_alt_late",
+    ],
+    "features": {
+        "llm_guide": True,
+        "city_dna": True,
+        "opening_hours": True,
+        "weather_required": True,
+        "presentation_endpoint": True,
+        "constraints_validation": True,
+    },
+    "constraints": [
+        "no_walk",
+        "indoor_only",
+        "outdoor_only",
+        "quiet",
+        "no_alcohol",
+        "vegan",
+        "vegetarian",
+        "kid_friendly",
+        "pet_friendly",
+        "wifi",
     ]
-    
-    return Response(
-        {
-            "engine_version": "v3",
-            "available_intents": available_intents,
-            "features": {
-                "llm_guide": True,
-                "city_dna": True,
-                "opening_hours": True,
-                "weather_required": True,
-                "presentation_endpoint": True,
-                "constraints_validation": True,
-            },
-            "constraints": [
-                "no_walk",
-                "indoor_only",
-                "outdoor_only",
-                "quiet",
-                "no_alcohol",
-                "vegan",
-                "vegetarian",
-                "kid_friendly",
-                "pet_friendly",
-                "wifi",
-            ]
-        }
-    )
\ No newline at end of file
+}
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def feature_flags(request):
+    """GET /api/feature-flags/ - Available features"""
+    response = Response(_FEATURE_FLAGS_PAYLOAD)
+    # Set here rather than via @cache_control so 401s aren't cached; private
+    # because the endpoint sits behind JWT auth
+    patch_cache_control(response, max_age=300, private=True)
+    return response